@@ -3,213 +3,346 @@
 Multi-Cloud Compute Node Counter
 
 Aggregates compute node counts across AWS, Azure, and Google Cloud Platform.
-Runs all provider scripts and combines results into a unified view.
+Runs all provider counters in-process and combines results into a unified view.
 """
 
+import csv
+import hashlib
 import json
-import sys
-import subprocess
-import tempfile
 import os
-from datetime import datetime
-from collections import defaultdict
+import sys
+import traceback
+import threading
+import time
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor, wait, ALL_COMPLETED
+from datetime import datetime, timezone
+from collections import Counter
+from operator import itemgetter
 
 import click
-from tabulate import tabulate
-from colorama import init, Fore, Style
-
-# Initialize colorama
-init(autoreset=True)
+from colorama import init, AnsiToWin32, Fore, Style
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+# Precomputed console banners
+_SEP = "=" * 80
+_CYAN_SEP = f"{Fore.CYAN}{_SEP}{Style.RESET_ALL}"
+_GREEN_SEP = f"{Fore.GREEN}{_SEP}{Style.RESET_ALL}"
+
+# Provider results are cached here between runs
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "csp-scripts")
+DEFAULT_CACHE_TTL = 300
+# Oldest cached results shown in place of a provider that failed
+STALE_CACHE_MAX_AGE = 24 * 60 * 60
+
+SUPPORTED_PROVIDERS = frozenset({"aws", "azure", "gcp"})
+
+# Map resource types to friendly names
+RESOURCE_NAMES = {
+    "ec2": "EC2 Instances",
+    "eks": "EKS Nodes",
+    "ecs": "ECS Tasks",
+    "lambda": "Lambda Functions",
+    "lightsail": "Lightsail Instances",
+    "batch": "Batch Nodes",
+    "vms": "Virtual Machines",
+    "aks": "AKS Nodes",
+    "aci": "Container Instances",
+    "functions": "Azure Functions",
+    "vmss": "VM Scale Sets",
+    "gce": "Compute Engine VMs",
+    "gke": "GKE Nodes",
+    "cloud_run": "Cloud Run Services",
+    "cloud_functions": "Cloud Functions",
+    "app_engine": "App Engine Instances",
+}
+
+
+def _json_bytes(data):
+    """Serialize data to indented JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+
+def _write_json_member(f, key, value, depth=1, last=False):
+    """Write one '"key": value' member of an indented JSON object to a binary file."""
+    indent = b"  " * depth
+    f.write(indent + _json_bytes(key) + b": " + _json_bytes(value).replace(b"\n", b"\n" + indent))
+    f.write(b"\n" if last else b",\n")
 
 
 class MultiCloudCounter:
     """Aggregate compute node counts across multiple cloud providers."""
 
-    def __init__(self, verbose=False):
+    _LOG_COLORS = {
+        "info": Fore.CYAN,
+        "success": Fore.GREEN,
+        "warning": Fore.YELLOW,
+        "error": Fore.RED,
+    }
+
+    def __init__(self, verbose=False, cache_ttl=DEFAULT_CACHE_TTL, use_cache=True):
         """
         Initialize multi-cloud counter.
 
         Args:
             verbose: Enable verbose logging
+            cache_ttl: Seconds cached provider results stay fresh (0 always re-counts)
+            use_cache: Read and write the on-disk provider results cache
         """
         self.verbose = verbose
+        self.cache_ttl = cache_ttl
+        self.use_cache = use_cache
+        # --no-cache and --cache-ttl 0 also make the provider counters re-list subscriptions/projects
+        self._use_provider_caches = use_cache and cache_ttl > 0
         self.results = {}
         self.errors = []
-        self.temp_dir = tempfile.gettempdir()
+        # provider -> {"generated_at", "stale"}, for results read from the cache
+        self.cached_results = {}
+        self._summary_cache = None
+        # Shared SDK sessions/credentials, built on first use and reused by every count
+        self._boto_session = None
+        self._azure_credential = None
+        self._gcp_credentials = None
+        self._started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        # Providers are counted concurrently; guards results, errors and console output
+        self._lock = threading.Lock()
+
+    @property
+    def boto_session(self):
+        """Shared boto3 session; its clients are safe to use across threads."""
+        if self._boto_session is None:
+            import boto3
+
+            self._boto_session = boto3.session.Session()
+        return self._boto_session
+
+    @property
+    def azure_credential(self):
+        """Shared Azure credential, so the token is acquired once per run."""
+        if self._azure_credential is None:
+            from azure.identity import DefaultAzureCredential
+
+            self._azure_credential = DefaultAzureCredential()
+        return self._azure_credential
+
+    @property
+    def gcp_credentials(self):
+        """Shared GCP credentials and default project, as returned by google.auth.default()."""
+        if self._gcp_credentials is None:
+            from google.auth import default as google_auth_default
+            from google.auth.exceptions import DefaultCredentialsError
+            from gcp_compute_counter import CREDENTIALS_NOT_FOUND
+
+            try:
+                self._gcp_credentials = google_auth_default()
+            except DefaultCredentialsError as e:
+                raise Exception(CREDENTIALS_NOT_FOUND) from e
+        return self._gcp_credentials
 
     def _log(self, message, level="info"):
         """Log message if verbose mode is enabled."""
-        if self.verbose:
-            colors = {
-                "info": Fore.CYAN,
-                "success": Fore.GREEN,
-                "warning": Fore.YELLOW,
-                "error": Fore.RED,
-            }
-            print(f"{colors.get(level, '')}{message}{Style.RESET_ALL}")
+        if not self.verbose:
+            return
 
-    def count_aws(self, regions=None):
-        """Count AWS compute resources."""
-        self._log("Counting AWS resources...", "info")
+        with self._lock:
+            print(f"{self._LOG_COLORS.get(level, '')}{message}{Style.RESET_ALL}")
+
+    def _add_result(self, provider, data):
+        """Record a provider's results."""
+        with self._lock:
+            self.results[provider] = data
+            self._summary_cache = None
+
+    def _add_error(self, error):
+        """Record a provider error."""
+        with self._lock:
+            self.errors.append(error)
+
+    def _add_cached(self, provider, cached, stale):
+        """Record that a provider's results were read from the cache."""
+        with self._lock:
+            self.cached_results[provider] = {"generated_at": cached["generated_at"], "stale": stale}
 
+    def _aws_identity(self):
+        """The AWS account the shared session signs in to."""
+        return self.boto_session.client("sts").get_caller_identity()["Account"]
+
+    def _azure_identity(self):
+        """The Azure tenant and object IDs the shared credential signs in as."""
+        from azure_compute_counter import credential_identity
+
+        return credential_identity(self.azure_credential)
+
+    def _gcp_identity(self):
+        """The GCP account the shared credentials act as."""
+        from gcp_compute_counter import credentials_principal
+
+        return credentials_principal(self.gcp_credentials[0])
+
+    def _cache_path(self, provider, identity, scope):
+        """Get the cache file path for a provider, its signed-in identity and its region/subscription/project filter."""
+        key = hashlib.sha1(f"{provider}|{identity}|{scope or ''}".encode("utf-8")).hexdigest()
+        return os.path.join(CACHE_DIR, f"{provider}-{key}.json")
+
+    def _load_cache(self, cache_path, max_age=None):
+        """Load a cache entry, or None if missing, unreadable or older than max_age seconds."""
         try:
-            # Create temp file for results
-            aws_results_file = os.path.join(self.temp_dir, "aws_results.json")
-
-            # Build command using current Python interpreter
-            cmd = [sys.executable, "aws_compute_counter.py", "--format", "json", "--output", aws_results_file]
-
-            if regions:
-                cmd.extend(["--regions", regions])
-
-            if self.verbose:
-                cmd.append("--verbose")
-
-            # Run AWS counter
-            result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-
-            if result.returncode == 0:
-                # Load results
-                with open(aws_results_file, "r") as f:
-                    self.results["aws"] = json.load(f)
-                # Clean up temp file
-                os.remove(aws_results_file)
-                self._log("AWS counting completed successfully", "success")
-            else:
-                error_msg = result.stderr or result.stdout
-                self._log(f"AWS counting failed: {error_msg}", "error")
-                self.errors.append(f"AWS: {error_msg}")
-
-        except FileNotFoundError:
-            error_msg = "aws_compute_counter.py not found"
-            self._log(error_msg, "error")
-            self.errors.append(f"AWS: {error_msg}")
+            if max_age is not None and time.time() - os.path.getmtime(cache_path) >= max_age:
+                return None
+            with open(cache_path, "rb") as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _save_cache(self, cache_path, data):
+        """Atomically write a provider's results to the cache."""
+        if not self.use_cache:
+            return
+
+        entry = {"generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"), "data": data}
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(_json_bytes(entry))
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            self._log(f"Could not write cache file {cache_path}: {e}", "warning")
+
+    def _count_provider(self, provider, label, scope, run_counter, identity):
+        """
+        Count one provider's resources, reusing cached results while they are fresh.
+
+        Results are cached per signed-in identity, so switching accounts never
+        returns another account's results; if the identity cannot be found,
+        nothing is cached. If the counter fails and an expired cache entry no older
+        than STALE_CACHE_MAX_AGE exists, the stale results are reported alongside
+        the error. Results read from the cache are recorded in cached_results.
+        A cache_ttl of 0 turns the cache off entirely.
+
+        Args:
+            provider: Results key ("aws", "azure" or "gcp")
+            label: Provider name for messages
+            scope: Region/subscription/project filter, part of the cache key
+            run_counter: Callable returning the provider's results dict
+            identity: Callable returning the account/principal the provider signs in as
+        """
+        self._log(f"Counting {label} resources...", "info")
+        cache_path = None
+        if self.use_cache and self.cache_ttl > 0:
+            try:
+                cache_path = self._cache_path(provider, identity(), scope)
+            except Exception as e:
+                self._log(f"Could not determine the {label} identity, not caching: {e}", "warning")
+
+        if cache_path is not None:
+            cached = self._load_cache(cache_path, max_age=self.cache_ttl)
+            if cached is not None:
+                self._add_result(provider, cached["data"])
+                self._add_cached(provider, cached, stale=False)
+                self._log(f"Using cached {label} results from {cached['generated_at']}", "success")
+                return
+
+        try:
+            data = run_counter()
+        except ImportError as e:
+            error_msg = f"Unable to load {provider}_compute_counter: {e}"
         except Exception as e:
-            self._log(f"AWS error: {e}", "error")
-            self.errors.append(f"AWS: {str(e)}")
+            error_msg = str(e)
+        else:
+            self._add_result(provider, data)
+            if cache_path is not None:
+                self._save_cache(cache_path, data)
+            self._log(f"{label} counting completed successfully", "success")
+            return
+
+        self._log(f"{label} error: {error_msg}", "error")
+        stale = self._load_cache(cache_path, max_age=STALE_CACHE_MAX_AGE) if cache_path is not None else None
+        if stale is not None:
+            self._add_result(provider, stale["data"])
+            self._add_cached(provider, stale, stale=True)
+            error_msg = f"{error_msg} (showing cached results from {stale['generated_at']})"
+        self._add_error(f"{label}: {error_msg}")
+
+    def count_aws(self, regions=None):
+        """Count AWS compute resources."""
+        def run_counter():
+            from aws_compute_counter import run as aws_run
+
+            region_list = [r.strip() for r in regions.split(",")] if regions else None
+            return aws_run(regions=region_list, verbose=self.verbose, session=self.boto_session)
+
+        self._count_provider("aws", "AWS", regions, run_counter, self._aws_identity)
 
     def count_azure(self, subscription_id=None):
         """Count Azure compute resources."""
-        self._log("Counting Azure resources...", "info")
+        def run_counter():
+            from azure_compute_counter import run as azure_run
 
-        try:
-            # Create temp file for results
-            azure_results_file = os.path.join(self.temp_dir, "azure_results.json")
-
-            # Build command using current Python interpreter
-            cmd = [sys.executable, "azure_compute_counter.py", "--format", "json", "--output", azure_results_file]
-
-            if subscription_id:
-                cmd.extend(["--subscription-id", subscription_id])
-
-            if self.verbose:
-                cmd.append("--verbose")
-
-            # Run Azure counter
-            result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-
-            if result.returncode == 0:
-                # Load results
-                with open(azure_results_file, "r") as f:
-                    self.results["azure"] = json.load(f)
-                # Clean up temp file
-                os.remove(azure_results_file)
-                self._log("Azure counting completed successfully", "success")
-            else:
-                error_msg = result.stderr or result.stdout
-                self._log(f"Azure counting failed: {error_msg}", "error")
-                self.errors.append(f"Azure: {error_msg}")
-
-        except FileNotFoundError:
-            error_msg = "azure_compute_counter.py not found"
-            self._log(error_msg, "error")
-            self.errors.append(f"Azure: {error_msg}")
-        except Exception as e:
-            self._log(f"Azure error: {e}", "error")
-            self.errors.append(f"Azure: {str(e)}")
+            return azure_run(subscription_id=subscription_id, verbose=self.verbose,
+                             credential=self.azure_credential, use_cache=self._use_provider_caches)
+
+        self._count_provider("azure", "Azure", subscription_id, run_counter, self._azure_identity)
 
     def count_gcp(self, project_id=None):
         """Count GCP compute resources."""
-        self._log("Counting GCP resources...", "info")
+        def run_counter():
+            from gcp_compute_counter import run as gcp_run
 
-        try:
-            # Create temp file for results
-            gcp_results_file = os.path.join(self.temp_dir, "gcp_results.json")
-
-            # Build command using current Python interpreter
-            cmd = [sys.executable, "gcp_compute_counter.py", "--format", "json", "--output", gcp_results_file]
-
-            if project_id:
-                cmd.extend(["--project", project_id])
-
-            if self.verbose:
-                cmd.append("--verbose")
-
-            # Run GCP counter
-            result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-
-            if result.returncode == 0:
-                # Load results
-                with open(gcp_results_file, "r") as f:
-                    self.results["gcp"] = json.load(f)
-                # Clean up temp file
-                os.remove(gcp_results_file)
-                self._log("GCP counting completed successfully", "success")
-            else:
-                error_msg = result.stderr or result.stdout
-                self._log(f"GCP counting failed: {error_msg}", "error")
-                self.errors.append(f"GCP: {error_msg}")
-
-        except FileNotFoundError:
-            error_msg = "gcp_compute_counter.py not found"
-            self._log(error_msg, "error")
-            self.errors.append(f"GCP: {error_msg}")
-        except Exception as e:
-            self._log(f"GCP error: {e}", "error")
-            self.errors.append(f"GCP: {str(e)}")
+            credentials, default_project = self.gcp_credentials
+            return gcp_run(project_id=project_id or default_project, verbose=self.verbose,
+                           credentials=credentials, use_cache=self._use_provider_caches)
+
+        self._count_provider("gcp", "GCP", project_id, run_counter, self._gcp_identity)
 
     def get_summary(self):
         """Generate aggregated summary across all providers."""
-        summary = []
-
-        # Map resource types to friendly names
-        resource_names = {
-            "ec2": "EC2 Instances",
-            "eks": "EKS Nodes",
-            "ecs": "ECS Tasks",
-            "lambda": "Lambda Functions",
-            "lightsail": "Lightsail Instances",
-            "batch": "Batch Nodes",
-            "vms": "Virtual Machines",
-            "aks": "AKS Nodes",
-            "aci": "Container Instances",
-            "functions": "Azure Functions",
-            "vmss": "VM Scale Sets",
-            "gce": "Compute Engine VMs",
-            "gke": "GKE Nodes",
-            "cloud_run": "Cloud Run Services",
-            "cloud_functions": "Cloud Functions",
-            "app_engine": "App Engine Instances",
-        }
+        return self._aggregate()[0]
 
-        # Aggregate by provider
-        for provider, data in self.results.items():
-            if "summary" in data:
-                for resource_type, count in data["summary"].items():
-                    resource_name = resource_names.get(resource_type, resource_type)
-                    summary.append([
-                        provider.upper(),
-                        resource_name,
-                        count,
-                    ])
+    def _aggregate(self):
+        """
+        Aggregate provider results in a single pass.
 
-        return summary
+        Returns:
+            Tuple of (summary rows of [provider, resource name, count],
+            totals by provider, grand total, column widths of the summary rows)
+        """
+        if self._summary_cache is None:
+            summary = []
+            provider_totals = Counter()
+            provider_width = resource_width = count_width = 0
+
+            for provider, data in self.results.items():
+                resources = data.get("summary")
+                if not resources:
+                    continue
+
+                provider_name = provider.upper()
+                provider_width = max(provider_width, len(provider_name))
+                for resource_type, count in resources.items():
+                    resource_name = RESOURCE_NAMES.get(resource_type, resource_type)
+                    resource_width = max(resource_width, len(resource_name))
+                    count_width = max(count_width, len(str(count)))
+                    summary.append([provider_name, resource_name, count])
+                provider_totals.update({provider_name: sum(resources.values())})
+
+            grand_total = sum(provider_totals.values())
+            widths = (provider_width, resource_width, count_width)
+            self._summary_cache = (summary, dict(provider_totals), grand_total, widths)
+
+        return self._summary_cache
 
     def print_summary(self):
         """Print aggregated summary to console."""
-        print(f"\n{Fore.CYAN}{'='*80}{Style.RESET_ALL}")
+        print(f"\n{_CYAN_SEP}")
         print(f"{Fore.CYAN}Multi-Cloud Compute Node Summary{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}{'='*80}{Style.RESET_ALL}\n")
+        print(f"{_CYAN_SEP}\n")
 
         if self.errors:
             print(f"{Fore.YELLOW}Errors encountered:{Style.RESET_ALL}")
@@ -217,71 +350,91 @@ class MultiCloudCounter:
                 print(f"  {Fore.RED}• {error}{Style.RESET_ALL}")
             print()
 
-        summary = self.get_summary()
+        summary, provider_totals, grand_total, widths = self._aggregate()
 
         if not summary:
             print(f"{Fore.YELLOW}No compute resources found across any provider.{Style.RESET_ALL}\n")
             return
 
-        # Sort by provider, then resource type
-        summary.sort(key=lambda x: (x[0], x[1]))
+        # Sort by provider, then resource type (without reordering the cached summary)
+        summary = sorted(summary, key=itemgetter(0, 1))
+
+        # Column widths come from the aggregate pass, so rows are formatted directly
+        w0 = max(len("Provider"), widths[0])
+        w1 = max(len("Resource Type"), widths[1])
+        w2 = max(len("Count"), widths[2])
 
         # Print detailed breakdown
         print(f"{Fore.GREEN}Detailed Breakdown:{Style.RESET_ALL}")
-        headers = ["Provider", "Resource Type", "Count"]
-        print(tabulate(summary, headers=headers, tablefmt="simple"))
+        lines = [f"{'Provider':<{w0}}  {'Resource Type':<{w1}}  {'Count':>{w2}}",
+                 f"{'-' * w0}  {'-' * w1}  {'-' * w2}"]
+        lines.extend(f"{provider:<{w0}}  {resource:<{w1}}  {count:>{w2}}" for provider, resource, count in summary)
+        print("\n".join(lines))
 
-        # Calculate totals by provider
+        # Totals by provider
         print(f"\n{Fore.GREEN}Provider Totals:{Style.RESET_ALL}")
-        provider_totals = defaultdict(int)
-        for row in summary:
-            provider_totals[row[0]] += row[2]
-
-        provider_summary = [[provider, total] for provider, total in sorted(provider_totals.items())]
-        print(tabulate(provider_summary, headers=["Provider", "Total Nodes"], tablefmt="simple"))
+        wt = max(len("Total Nodes"), len(str(max(provider_totals.values()))))
+        lines = [f"{'Provider':<{w0}}  {'Total Nodes':>{wt}}", f"{'-' * w0}  {'-' * wt}"]
+        lines.extend(
+            f"{provider:<{w0}}  {total:>{wt}}" for provider, total in sorted(provider_totals.items(), key=itemgetter(0))
+        )
+        print("\n".join(lines))
+
+        for provider, entry in sorted(self.cached_results.items()):
+            reason = "stale: counting failed" if entry["stale"] else "cached"
+            print(f"{Fore.YELLOW}{provider.upper()} results are from {entry['generated_at']} ({reason})"
+                  f"{Style.RESET_ALL}")
 
         # Grand total
-        grand_total = sum(provider_totals.values())
-        print(f"\n{Fore.GREEN}{'='*80}{Style.RESET_ALL}")
+        print(f"\n{_GREEN_SEP}")
         print(f"{Fore.GREEN}Grand Total Across All Clouds: {grand_total:,} compute nodes{Style.RESET_ALL}")
-        print(f"{Fore.GREEN}{'='*80}{Style.RESET_ALL}\n")
+        print(f"{_GREEN_SEP}\n")
 
-    def export_json(self, output_file):
-        """Export aggregated results to JSON."""
-        # Calculate summary
-        summary = self.get_summary()
+    def write_json(self, f):
+        """
+        Write aggregated results as JSON to a binary file object.
 
-        provider_totals = defaultdict(int)
-        for row in summary:
-            provider_totals[row[0]] += row[2]
-
-        data = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "multi_cloud_summary": {
-                "providers": dict(provider_totals),
-                "grand_total": sum(provider_totals.values()),
-            },
-            "detailed_results": self.results,
-            "errors": self.errors,
+        Each provider's results are serialized and written on their own, so the
+        full document is never built as a single string in memory.
+        """
+        _, provider_totals, grand_total, _ = self._aggregate()
+        summary = {
+            "providers": provider_totals,
+            "grand_total": grand_total,
         }
 
-        with open(output_file, "w") as f:
-            json.dump(data, f, indent=2)
+        f.write(b"{\n")
+        _write_json_member(f, "timestamp", self._started_at)
+        _write_json_member(f, "multi_cloud_summary", summary)
+
+        f.write(b'  "detailed_results": {')
+        if self.results:
+            f.write(b"\n")
+            providers = list(self.results.items())
+            for i, (provider, data) in enumerate(providers, start=1):
+                _write_json_member(f, provider, data, depth=2, last=i == len(providers))
+            f.write(b"  ")
+        f.write(b"},\n")
+
+        _write_json_member(f, "cached_results", self.cached_results)
+        _write_json_member(f, "errors", self.errors, last=True)
+        f.write(b"}")
+
+    def export_json(self, output_file):
+        """Export aggregated results to JSON."""
+        with open(output_file, "wb") as f:
+            self.write_json(f)
 
         print(f"{Fore.GREEN}Aggregated results exported to {output_file}{Style.RESET_ALL}")
 
     def export_csv(self, output_file):
         """Export aggregated results to CSV."""
-        import csv
-
         summary = self.get_summary()
 
-        with open(output_file, "w", newline="") as f:
+        with open(output_file, "w", newline="", buffering=1 << 20) as f:
             writer = csv.writer(f)
             writer.writerow(["Provider", "Resource Type", "Count"])
-
-            for row in summary:
-                writer.writerow(row)
+            writer.writerows(summary)
 
         print(f"{Fore.GREEN}Aggregated results exported to {output_file}{Style.RESET_ALL}")
 
@@ -324,58 +477,106 @@ class MultiCloudCounter:
     is_flag=True,
     help="Enable verbose output with detailed logging",
 )
-def main(providers, aws_regions, azure_subscription, gcp_project, output, output_format, verbose):
+@click.option(
+    "--cache-ttl",
+    type=click.IntRange(min=0),
+    help=f"Seconds to reuse cached provider results (default: {DEFAULT_CACHE_TTL}, 0 always re-counts)",
+    default=DEFAULT_CACHE_TTL,
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Do not read or write the provider results cache",
+)
+@click.option(
+    "--quiet",
+    "--json-only",
+    is_flag=True,
+    help="Skip the console summary; write JSON to stdout unless --output is given",
+)
+def main(providers, aws_regions, azure_subscription, gcp_project, output, output_format, verbose,
+         cache_ttl, no_cache, quiet):
     """
     Count compute nodes across multiple cloud providers.
 
     Aggregates results from AWS, Azure, and GCP into a unified view.
     """
-    try:
-        # Parse providers
-        provider_list = [p.strip().lower() for p in providers.split(",")]
-
-        print(f"\n{Fore.CYAN}{'='*80}{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}Starting Multi-Cloud Compute Node Count{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}Providers: {', '.join([p.upper() for p in provider_list])}{Style.RESET_ALL}")
-        print(f"{Fore.CYAN}{'='*80}{Style.RESET_ALL}\n")
-
-        # Initialize counter
-        counter = MultiCloudCounter(verbose=verbose)
-
-        # Count resources for each provider
-        if "aws" in provider_list:
-            counter.count_aws(regions=aws_regions)
-
-        if "azure" in provider_list:
-            counter.count_azure(subscription_id=azure_subscription)
-
-        if "gcp" in provider_list:
-            counter.count_gcp(project_id=gcp_project)
-
-        # Print summary
-        counter.print_summary()
-
-        # Export if requested
-        if output:
-            if output_format == "json":
-                counter.export_json(output)
-            elif output_format == "csv":
-                counter.export_csv(output)
-
-        # Exit with error code if all providers failed
-        if len(counter.errors) == len(provider_list):
-            print(f"\n{Fore.RED}All providers failed. Please check credentials and try again.{Style.RESET_ALL}")
+    # In quiet mode stdout carries only the JSON document. Everything else, including
+    # the provider modules' own logging, is redirected to stderr with colours stripped.
+    json_stream = sys.stdout
+    if quiet:
+        console = AnsiToWin32(sys.stderr, strip=True).stream
+    else:
+        init(autoreset=True)
+        console = sys.stdout
+
+    with redirect_stdout(console):
+        try:
+            # Parse and validate providers
+            provider_set = frozenset(p.strip().lower() for p in providers.split(",") if p.strip())
+            unknown = provider_set - SUPPORTED_PROVIDERS
+            if unknown or not provider_set:
+                problem = f"Unknown provider(s): {', '.join(sorted(unknown))}" if unknown else "No providers specified"
+                print(f"\n{Fore.RED}Error: {problem}{Style.RESET_ALL}")
+                print(f"Valid providers are: {', '.join(sorted(SUPPORTED_PROVIDERS))}")
+                sys.exit(2)
+
+            if not quiet:
+                print(f"\n{_CYAN_SEP}")
+                print(f"{Fore.CYAN}Starting Multi-Cloud Compute Node Count{Style.RESET_ALL}")
+                print(f"{Fore.CYAN}Providers: {', '.join(sorted(p.upper() for p in provider_set))}{Style.RESET_ALL}")
+                print(f"{_CYAN_SEP}\n")
+
+            # Initialize counter
+            counter = MultiCloudCounter(verbose=verbose, cache_ttl=cache_ttl, use_cache=not no_cache)
+
+            # Count resources for each provider concurrently; each is independent and I/O-bound
+            tasks = [
+                ("aws", counter.count_aws, {"regions": aws_regions}),
+                ("azure", counter.count_azure, {"subscription_id": azure_subscription}),
+                ("gcp", counter.count_gcp, {"project_id": gcp_project}),
+            ]
+            tasks = [task for task in tasks if task[0] in provider_set]
+
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                futures = {executor.submit(func, **kwargs): name for name, func, kwargs in tasks}
+                wait(futures, return_when=ALL_COMPLETED)
+
+            for future, name in futures.items():
+                error = future.exception()
+                if error is not None:
+                    counter._log(f"{name.upper()} error: {error}", "error")
+                    counter._add_error(f"{name.upper()}: {error}")
+
+            # Print summary
+            if not quiet:
+                counter.print_summary()
+
+            # Export if requested
+            if output:
+                if output_format == "json":
+                    counter.export_json(output)
+                elif output_format == "csv":
+                    counter.export_csv(output)
+            elif quiet:
+                json_stream.flush()
+                counter.write_json(json_stream.buffer)
+                json_stream.buffer.write(b"\n")
+                json_stream.buffer.flush()
+
+            # Exit with error code if all providers failed; stale cached results still count as results
+            if not provider_set & counter.results.keys():
+                print(f"\n{Fore.RED}All providers failed. Please check credentials and try again.{Style.RESET_ALL}")
+                sys.exit(1)
+
+        except KeyboardInterrupt:
+            print(f"\n{Fore.YELLOW}Operation cancelled by user.{Style.RESET_ALL}")
+            sys.exit(1)
+        except Exception as e:
+            print(f"\n{Fore.RED}Error: {e}{Style.RESET_ALL}")
+            if verbose:
+                traceback.print_exc()
             sys.exit(1)
-
-    except KeyboardInterrupt:
-        print(f"\n{Fore.YELLOW}Operation cancelled by user.{Style.RESET_ALL}")
-        sys.exit(1)
-    except Exception as e:
-        print(f"\n{Fore.RED}Error: {e}{Style.RESET_ALL}")
-        if verbose:
-            import traceback
-            traceback.print_exc()
-        sys.exit(1)
 
 
 if __name__ == "__main__":
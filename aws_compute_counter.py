@@ -8,52 +8,163 @@ ECS tasks, Lambda functions, Lightsail instances, and Batch compute environments
 
 import json
 import csv
+import os
 import sys
+import threading
+import time
+import traceback
 from collections import defaultdict
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
 import boto3
 import click
+import jmespath
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError, PartialCredentialsError
 from tabulate import tabulate
 from colorama import init, Fore, Style
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
 # Initialize colorama for cross-platform colored output
 init(autoreset=True)
 
+# Threads used to scan regions in parallel; boto3 degrades with many more than this
+MAX_WORKERS = 16
+
+# Per account/region/service results are cached here when --cache-ttl is set
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "csp-scripts", "aws")
+
+# Shared client config: a pool large enough for the region threads, and adaptive
+# retries so throttled calls back off smoothly instead of failing
+BOTO_CONFIG = Config(
+    max_pool_connections=64,
+    retries={"max_attempts": 10, "mode": "adaptive"},
+    tcp_keepalive=True,
+    user_agent_extra="csp-counter",
+)
+
+# Instances in these states are counted; terminated and shutting-down ones are not
+EC2_INSTANCE_STATES = ["pending", "running", "stopping", "stopped"]
+
+# JMESPath projections applied to each page, so only the needed fields are walked
+EC2_INSTANCE_COUNT = jmespath.compile("length(Reservations[].Instances[])")
+EC2_INSTANCE_FIELDS = jmespath.compile("Reservations[].Instances[].[InstanceId, InstanceType, State.Name]")
+LAMBDA_FUNCTION_FIELDS = jmespath.compile("Functions[].[FunctionName, Runtime, MemorySize]")
+LIGHTSAIL_INSTANCE_FIELDS = jmespath.compile("instances[].[name, blueprintName, state.name]")
+
+
+def _json_bytes(data):
+    """Serialize data to indented JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+
+def _nest(flat):
+    """Regroup a dict keyed by (service, region) into {service: {region: value}}."""
+    nested = defaultdict(dict)
+    for (service, region), value in flat.items():
+        nested[service][region] = value
+    return dict(nested)
+
 
 class AWSComputeCounter:
     """Count compute resources across AWS services."""
 
-    def __init__(self, regions=None, verbose=False):
+    _LOG_COLORS = {
+        "info": Fore.CYAN,
+        "success": Fore.GREEN,
+        "warning": Fore.YELLOW,
+        "error": Fore.RED,
+    }
+
+    def __init__(self, regions=None, verbose=False, session=None, collect_details=True,
+                 use_resource_explorer=False, cache_ttl=0, max_workers=MAX_WORKERS):
         """
         Initialize AWS compute counter.
 
         Args:
             regions: List of AWS regions to query (None for all regions)
             verbose: Enable verbose logging
+            session: Optional boto3.Session to create clients from (default: a new session)
+            collect_details: Record per-resource details in region_details (False counts only)
+            use_resource_explorer: Count EC2 instances with one AWS Resource Explorer query
+                instead of scanning each region
+            cache_ttl: Seconds to reuse cached per-region results (0 disables the cache)
+            max_workers: Threads used to scan regions (and to describe EKS nodegroups)
         """
         self.verbose = verbose
-        self.regions = regions or self._get_all_regions()
-        self.results = defaultdict(lambda: defaultdict(int))
-        self.region_details = defaultdict(lambda: defaultdict(list))
+        if not verbose:
+            # Skip message formatting entirely on the hot path
+            self._log = lambda message, level="info": None
+        self.collect_details = collect_details
+        self.use_resource_explorer = use_resource_explorer
+        self.cache_ttl = cache_ttl
+        self._account = None
+        self.session = session or boto3.session.Session()
+        self._clients = {}
+        self._service_region_cache = {}
+        # Each client's connection pool must fit every thread that may share it
+        self._boto_config = BOTO_CONFIG.merge(
+            Config(max_pool_connections=max(BOTO_CONFIG.max_pool_connections, max_workers))
+        )
+        # Regions are scanned concurrently; results are merged under the lock
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Separate pool for nested nodegroup lookups, so region tasks never wait on their own pool
+        self._nodegroup_executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._client_lock = threading.Lock()
+        # Sorted once here so summaries can list regions in order without re-sorting
+        try:
+            self.regions = sorted(regions or self._get_all_regions())
+        except Exception:
+            self.close()
+            raise
+        # Flat maps keyed by (service, region); nested per service only for export
+        self.results = defaultdict(int)
+        self.region_details = defaultdict(list)
+        # Running per-service totals, updated as regions are recorded
+        self._totals = defaultdict(int)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the region and nodegroup worker pools."""
+        self._executor.shutdown(wait=False)
+        self._nodegroup_executor.shutdown(wait=False)
 
     def _log(self, message, level="info"):
-        """Log message if verbose mode is enabled."""
-        if self.verbose:
-            colors = {
-                "info": Fore.CYAN,
-                "success": Fore.GREEN,
-                "warning": Fore.YELLOW,
-                "error": Fore.RED,
-            }
-            print(f"{colors.get(level, '')}{message}{Style.RESET_ALL}")
+        """Log message (replaced by a no-op in __init__ unless verbose)."""
+        print(f"{self._LOG_COLORS.get(level, '')}{message}{Style.RESET_ALL}")
+
+    def _client(self, service, region):
+        """Get the cached client for a service in a region, creating it on first use."""
+        key = (service, region)
+        client = self._clients.get(key)
+        if client is None:
+            # Client creation from a session is not thread-safe; using the clients is
+            with self._client_lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = self.session.client(
+                        service, region_name=region, config=self._boto_config
+                    )
+        return client
 
     def _get_all_regions(self):
         """Get all available AWS regions."""
         try:
             # Use us-east-1 as the endpoint to query for all regions
-            ec2 = boto3.client("ec2", region_name="us-east-1")
+            ec2 = self._client("ec2", "us-east-1")
             response = ec2.describe_regions()
             regions = [region["RegionName"] for region in response["Regions"]]
             self._log(f"Found {len(regions)} AWS regions", "success")
@@ -66,227 +177,467 @@ class AWSComputeCounter:
             )
             raise Exception(error_msg) from e
 
+    def _service_regions(self, service):
+        """
+        Get the selected regions where a service is available.
+
+        Availability comes from the SSM global infrastructure public parameters and
+        is looked up once per service. EC2 runs in every enabled region, so it is
+        not looked up. If the lookup fails, all selected regions are returned.
+        """
+        if service == "ec2":
+            return self.regions
+
+        if service not in self._service_region_cache:
+            try:
+                ssm = self._client("ssm", "us-east-1")
+                paginator = ssm.get_paginator("get_parameters_by_path")
+                path = f"/aws/service/global-infrastructure/services/{service}/regions"
+                available = {
+                    param["Value"]
+                    for page in paginator.paginate(Path=path)
+                    for param in page["Parameters"]
+                }
+                regions = [region for region in self.regions if region in available]
+                skipped = len(self.regions) - len(regions)
+                if skipped:
+                    self._log(f"  Skipping {skipped} regions where {service} is not available", "info")
+            except Exception as e:
+                self._log(f"  Could not look up {service} regions, scanning all: {e}", "warning")
+                regions = self.regions
+            self._service_region_cache[service] = regions
+
+        return self._service_region_cache[service]
+
+    def _account_id(self):
+        """Get the caller's account ID (used to key the cache), or None if it can't be found."""
+        # Looked up without the lock, so the STS call never blocks result merging.
+        # count_all looks it up before fanning out, so it normally runs once.
+        if self._account is None:
+            try:
+                self._account = self._client("sts", "us-east-1").get_caller_identity()["Account"]
+            except Exception as e:
+                self._log(f"  Could not determine AWS account, not caching: {e}", "warning")
+                self._account = ""
+        return self._account or None
+
+    def _cached(self, service, count_region):
+        """
+        Wrap a per-region count function with the on-disk results cache.
+
+        Entries live at CACHE_DIR/<account>/<region>/<service>.json and are reused
+        while younger than cache_ttl seconds. Failed regions are not cached.
+        """
+        account = self._account_id()
+        if account is None:
+            return count_region
+
+        suffix = "" if self.collect_details else "-count"
+
+        def cached_count_region(region):
+            path = os.path.join(CACHE_DIR, account, region, f"{service}{suffix}.json")
+            try:
+                if time.time() - os.path.getmtime(path) < self.cache_ttl:
+                    with open(path, "rb") as f:
+                        count, details = json.loads(f.read())
+                    self._log(f"  {region}: using cached {service} results", "info")
+                    return count, details
+            except (OSError, ValueError):
+                pass
+
+            result = count_region(region)
+            if result is not None:
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(tmp_path, "wb") as f:
+                        f.write(_json_bytes(list(result)))
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    self._log(f"  Could not write cache file {path}: {e}", "warning")
+            return result
+
+        return cached_count_region
+
+    def _run_regions(self, service, count_region):
+        """
+        Count one service in every region where it is available, concurrently, and merge the results.
+
+        Args:
+            service: Results key for the service
+            count_region: Callable taking a region and returning (count, details),
+                or None if the region could not be counted
+        """
+        if self.cache_ttl > 0:
+            count_region = self._cached(service, count_region)
+
+        regions = self._service_regions(service)
+        for region, result in zip(regions, self._executor.map(count_region, regions)):
+            if result is None:
+                continue
+
+            count, details = result
+            with self._lock:
+                if details:
+                    self.region_details[(service, region)].extend(details)
+                if count > 0:
+                    self._set_result(service, region, count)
+
+    def _set_result(self, service, region, count):
+        """Record a region's count and keep the per-service total in step (caller holds the lock)."""
+        self._totals[service] += count - self.results.get((service, region), 0)
+        self.results[(service, region)] = count
+
     def count_ec2_instances(self):
         """Count EC2 instances across all regions."""
         self._log("Counting EC2 instances...", "info")
 
-        for region in self.regions:
-            try:
-                ec2 = boto3.client("ec2", region_name=region)
-                paginator = ec2.get_paginator("describe_instances")
-
-                count = 0
-                for page in paginator.paginate():
-                    for reservation in page["Reservations"]:
-                        for instance in reservation["Instances"]:
-                            count += 1
-                            self.region_details["ec2"][region].append({
-                                "id": instance["InstanceId"],
-                                "type": instance["InstanceType"],
-                                "state": instance["State"]["Name"],
-                            })
+        if self.use_resource_explorer:
+            instances = self._search_ec2_instances()
+            if instances is not None:
+                for region, instance_ids in instances.items():
+                    with self._lock:
+                        self._set_result("ec2", region, len(instance_ids))
+                        if self.collect_details:
+                            self.region_details[("ec2", region)].extend({"id": i} for i in instance_ids)
+                    self._log(f"  {region}: {len(instance_ids)} EC2 instances", "success")
+                return
 
-                if count > 0:
-                    self.results["ec2"][region] = count
-                    self._log(f"  {region}: {count} EC2 instances", "success")
+        self._run_regions("ec2", self._count_ec2_region)
 
-            except ClientError as e:
-                self._log(f"  {region}: Error - {e}", "error")
-            except Exception as e:
-                self._log(f"  {region}: Unexpected error - {e}", "error")
+    def _search_ec2_instances(self):
+        """
+        Find EC2 instances in all regions with a single Resource Explorer search.
+
+        Resource Explorer must have an aggregator index and default view set up;
+        only searches in the aggregator index's region cover every region. It does
+        not report instance state, so every indexed instance is counted.
+
+        Returns:
+            Dict of region to instance IDs, or None if the search failed or was
+            incomplete and regions should be scanned instead
+        """
+        try:
+            explorer = self._client("resource-explorer-2", self.session.region_name or "us-east-1")
+            aggregators = explorer.list_indexes(Type="AGGREGATOR").get("Indexes", [])
+            if not aggregators:
+                self._log("  No Resource Explorer aggregator index, scanning regions instead", "warning")
+                return None
+
+            explorer = self._client("resource-explorer-2", aggregators[0]["Region"])
+            paginator = explorer.get_paginator("search")
+
+            regions = set(self.regions)
+            instances = defaultdict(list)
+            for page in paginator.paginate(QueryString="service:ec2 resourcetype:ec2:instance"):
+                if not page.get("Count", {}).get("Complete", True):
+                    self._log("  Resource Explorer results are incomplete, scanning regions instead", "warning")
+                    return None
+
+                for resource in page.get("Resources", []):
+                    if resource["Region"] in regions:
+                        instances[resource["Region"]].append(resource["Arn"].rsplit("/", 1)[-1])
+
+            return instances
+
+        except Exception as e:
+            self._log(f"  Resource Explorer search failed, scanning regions instead: {e}", "warning")
+            return None
+
+    def _count_ec2_region(self, region):
+        """Count EC2 instances in one region."""
+        try:
+            ec2 = self._client("ec2", region)
+            paginator = ec2.get_paginator("describe_instances")
+
+            pages = paginator.paginate(
+                Filters=[{"Name": "instance-state-name", "Values": EC2_INSTANCE_STATES}]
+            )
+
+            count = 0
+            details = []
+            for page in pages:
+                if self.collect_details:
+                    instances = EC2_INSTANCE_FIELDS.search(page) or []
+                    count += len(instances)
+                    details.extend(
+                        {"id": instance_id, "type": instance_type, "state": state}
+                        for instance_id, instance_type, state in instances
+                    )
+                else:
+                    count += EC2_INSTANCE_COUNT.search(page)
+
+            if count > 0:
+                self._log(f"  {region}: {count} EC2 instances", "success")
+            return count, details
+
+        except ClientError as e:
+            self._log(f"  {region}: Error - {e}", "error")
+        except Exception as e:
+            self._log(f"  {region}: Unexpected error - {e}", "error")
+        return None
 
     def count_eks_nodes(self):
         """Count EKS cluster nodes across all regions."""
         self._log("Counting EKS nodes...", "info")
+        self._run_regions("eks", self._count_eks_region)
 
-        for region in self.regions:
-            try:
-                eks = boto3.client("eks", region_name=region)
-                ec2 = boto3.client("ec2", region_name=region)
-
-                clusters = eks.list_clusters()["clusters"]
-                total_nodes = 0
-
-                for cluster_name in clusters:
-                    try:
-                        # Get node groups
-                        nodegroups = eks.list_nodegroups(clusterName=cluster_name)["nodegroups"]
-
-                        for ng_name in nodegroups:
-                            ng_info = eks.describe_nodegroup(
-                                clusterName=cluster_name,
-                                nodegroupName=ng_name
-                            )["nodegroup"]
-
-                            current_size = ng_info.get("scalingConfig", {}).get("desiredSize", 0)
-                            total_nodes += current_size
-
-                            self.region_details["eks"][region].append({
-                                "cluster": cluster_name,
-                                "nodegroup": ng_name,
-                                "nodes": current_size,
-                            })
-                    except Exception as e:
-                        self._log(f"  Error processing cluster {cluster_name}: {e}", "error")
-
-                if total_nodes > 0:
-                    self.results["eks"][region] = total_nodes
-                    self._log(f"  {region}: {total_nodes} EKS nodes in {len(clusters)} clusters", "success")
-
-            except ClientError as e:
-                if e.response["Error"]["Code"] != "AccessDeniedException":
-                    self._log(f"  {region}: Error - {e}", "error")
-            except Exception as e:
-                self._log(f"  {region}: Unexpected error - {e}", "error")
+    def _count_eks_region(self, region):
+        """Count EKS nodes in one region."""
+        try:
+            eks = self._client("eks", region)
+
+            clusters = [
+                cluster_name
+                for page in eks.get_paginator("list_clusters").paginate()
+                for cluster_name in page["clusters"]
+            ]
+
+            # Collect every (cluster, nodegroup) pair, then describe them concurrently
+            nodegroups = []
+            for cluster_name in clusters:
+                try:
+                    for page in eks.get_paginator("list_nodegroups").paginate(clusterName=cluster_name):
+                        nodegroups.extend((cluster_name, ng_name) for ng_name in page["nodegroups"])
+                except Exception as e:
+                    self._log(f"  Error processing cluster {cluster_name}: {e}", "error")
+
+            def describe(pair):
+                cluster_name, ng_name = pair
+                try:
+                    return eks.describe_nodegroup(clusterName=cluster_name, nodegroupName=ng_name)["nodegroup"]
+                except Exception as e:
+                    self._log(f"  Error processing cluster {cluster_name}: {e}", "error")
+                    return None
+
+            total_nodes = 0
+            details = []
+            for (cluster_name, ng_name), ng_info in zip(nodegroups, self._nodegroup_executor.map(describe, nodegroups)):
+                if ng_info is None:
+                    continue
+
+                current_size = ng_info.get("scalingConfig", {}).get("desiredSize", 0)
+                total_nodes += current_size
+
+                if self.collect_details:
+                    details.append({
+                        "cluster": cluster_name,
+                        "nodegroup": ng_name,
+                        "nodes": current_size,
+                    })
+
+            if total_nodes > 0:
+                self._log(f"  {region}: {total_nodes} EKS nodes in {len(clusters)} clusters", "success")
+            return total_nodes, details
+
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "AccessDeniedException":
+                self._log(f"  {region}: Error - {e}", "error")
+        except Exception as e:
+            self._log(f"  {region}: Unexpected error - {e}", "error")
+        return None
 
     def count_ecs_tasks(self):
         """Count running ECS tasks across all regions."""
         self._log("Counting ECS tasks...", "info")
+        self._run_regions("ecs", self._count_ecs_region)
 
-        for region in self.regions:
-            try:
-                ecs = boto3.client("ecs", region_name=region)
-
-                clusters = ecs.list_clusters()["clusterArns"]
-                total_tasks = 0
-
-                for cluster_arn in clusters:
-                    try:
-                        tasks = ecs.list_tasks(cluster=cluster_arn, desiredStatus="RUNNING")
-                        task_count = len(tasks.get("taskArns", []))
-                        total_tasks += task_count
-
-                        if task_count > 0:
-                            cluster_name = cluster_arn.split("/")[-1]
-                            self.region_details["ecs"][region].append({
-                                "cluster": cluster_name,
-                                "running_tasks": task_count,
-                            })
-                    except Exception as e:
-                        self._log(f"  Error processing cluster: {e}", "error")
+    def _count_ecs_region(self, region):
+        """Count running ECS tasks in one region."""
+        try:
+            ecs = self._client("ecs", region)
+
+            clusters = [
+                cluster_arn
+                for page in ecs.get_paginator("list_clusters").paginate()
+                for cluster_arn in page["clusterArns"]
+            ]
+            total_tasks = 0
+            details = []
+
+            for cluster_arn in clusters:
+                try:
+                    pages = ecs.get_paginator("list_tasks").paginate(cluster=cluster_arn, desiredStatus="RUNNING")
+                    task_count = sum(len(page.get("taskArns", [])) for page in pages)
+                    total_tasks += task_count
+
+                    if task_count > 0 and self.collect_details:
+                        cluster_name = cluster_arn.rpartition("/")[2]
+                        details.append({
+                            "cluster": cluster_name,
+                            "running_tasks": task_count,
+                        })
+                except Exception as e:
+                    self._log(f"  Error processing cluster: {e}", "error")
 
-                if total_tasks > 0:
-                    self.results["ecs"][region] = total_tasks
-                    self._log(f"  {region}: {total_tasks} running ECS tasks", "success")
+            if total_tasks > 0:
+                self._log(f"  {region}: {total_tasks} running ECS tasks", "success")
+            return total_tasks, details
 
-            except ClientError as e:
-                if e.response["Error"]["Code"] != "AccessDeniedException":
-                    self._log(f"  {region}: Error - {e}", "error")
-            except Exception as e:
-                self._log(f"  {region}: Unexpected error - {e}", "error")
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "AccessDeniedException":
+                self._log(f"  {region}: Error - {e}", "error")
+        except Exception as e:
+            self._log(f"  {region}: Unexpected error - {e}", "error")
+        return None
 
     def count_lambda_functions(self):
         """Count Lambda functions across all regions."""
         self._log("Counting Lambda functions...", "info")
+        self._run_regions("lambda", self._count_lambda_region)
 
-        for region in self.regions:
-            try:
-                lambda_client = boto3.client("lambda", region_name=region)
-                paginator = lambda_client.get_paginator("list_functions")
-
-                count = 0
-                for page in paginator.paginate():
-                    functions = page.get("Functions", [])
+    def _count_lambda_region(self, region):
+        """Count Lambda functions in one region."""
+        try:
+            lambda_client = self._client("lambda", region)
+            paginator = lambda_client.get_paginator("list_functions")
+
+            count = 0
+            details = []
+            for page in paginator.paginate():
+                if self.collect_details:
+                    functions = LAMBDA_FUNCTION_FIELDS.search(page) or []
                     count += len(functions)
-
-                    for func in functions:
-                        self.region_details["lambda"][region].append({
-                            "name": func["FunctionName"],
-                            "runtime": func.get("Runtime", "N/A"),
-                            "memory": func.get("MemorySize", 0),
-                        })
-
-                if count > 0:
-                    self.results["lambda"][region] = count
-                    self._log(f"  {region}: {count} Lambda functions", "success")
-
-            except ClientError as e:
-                if e.response["Error"]["Code"] != "AccessDeniedException":
-                    self._log(f"  {region}: Error - {e}", "error")
-            except Exception as e:
-                self._log(f"  {region}: Unexpected error - {e}", "error")
+                    details.extend(
+                        {"name": name, "runtime": runtime or "N/A", "memory": memory or 0}
+                        for name, runtime, memory in functions
+                    )
+                else:
+                    count += len(page.get("Functions", []))
+
+            if count > 0:
+                self._log(f"  {region}: {count} Lambda functions", "success")
+            return count, details
+
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "AccessDeniedException":
+                self._log(f"  {region}: Error - {e}", "error")
+        except Exception as e:
+            self._log(f"  {region}: Unexpected error - {e}", "error")
+        return None
 
     def count_lightsail_instances(self):
         """Count Lightsail instances across all regions."""
         self._log("Counting Lightsail instances...", "info")
+        self._run_regions("lightsail", self._count_lightsail_region)
 
-        for region in self.regions:
-            try:
-                lightsail = boto3.client("lightsail", region_name=region)
-                response = lightsail.get_instances()
-
-                instances = response.get("instances", [])
-                count = len(instances)
-
-                if count > 0:
-                    for instance in instances:
-                        self.region_details["lightsail"][region].append({
-                            "name": instance["name"],
-                            "blueprint": instance.get("blueprintName", "N/A"),
-                            "state": instance["state"]["name"],
-                        })
-
-                    self.results["lightsail"][region] = count
-                    self._log(f"  {region}: {count} Lightsail instances", "success")
-
-            except ClientError as e:
-                if e.response["Error"]["Code"] not in ["AccessDeniedException", "InvalidInputException"]:
-                    self._log(f"  {region}: Error - {e}", "error")
-            except Exception as e:
-                self._log(f"  {region}: Unexpected error - {e}", "error")
+    def _count_lightsail_region(self, region):
+        """Count Lightsail instances in one region."""
+        try:
+            lightsail = self._client("lightsail", region)
+            paginator = lightsail.get_paginator("get_instances")
+
+            count = 0
+            details = []
+            for page in paginator.paginate():
+                if self.collect_details:
+                    instances = LIGHTSAIL_INSTANCE_FIELDS.search(page) or []
+                    count += len(instances)
+                    details.extend(
+                        {"name": name, "blueprint": blueprint or "N/A", "state": state}
+                        for name, blueprint, state in instances
+                    )
+                else:
+                    count += len(page.get("instances", []))
+
+            if count > 0:
+                self._log(f"  {region}: {count} Lightsail instances", "success")
+            return count, details
+
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ["AccessDeniedException", "InvalidInputException"]:
+                self._log(f"  {region}: Error - {e}", "error")
+        except Exception as e:
+            self._log(f"  {region}: Unexpected error - {e}", "error")
+        return None
 
     def count_batch_compute(self):
         """Count AWS Batch compute environments across all regions."""
         self._log("Counting Batch compute environments...", "info")
+        self._run_regions("batch", self._count_batch_region)
 
-        for region in self.regions:
-            try:
-                batch = boto3.client("batch", region_name=region)
-                response = batch.describe_compute_environments()
-
-                environments = response.get("computeEnvironments", [])
-                total_instances = 0
-
-                for env in environments:
-                    if env["state"] == "ENABLED":
-                        # Get desired vCPUs as a proxy for compute nodes
-                        compute_resources = env.get("computeResources", {})
-                        desired = compute_resources.get("desiredvCpus", 0)
-
-                        if desired > 0:
-                            # Rough estimate: divide by 2 for node count
-                            nodes = max(1, desired // 2)
-                            total_instances += nodes
+    def _count_batch_region(self, region):
+        """Count AWS Batch compute nodes in one region."""
+        try:
+            batch = self._client("batch", region)
+            paginator = batch.get_paginator("describe_compute_environments")
 
-                            self.region_details["batch"][region].append({
+            environments = (
+                env
+                for page in paginator.paginate()
+                for env in page.get("computeEnvironments", [])
+            )
+            total_instances = 0
+            details = []
+
+            for env in environments:
+                if env["state"] == "ENABLED":
+                    # Get desired vCPUs as a proxy for compute nodes
+                    compute_resources = env.get("computeResources", {})
+                    desired = compute_resources.get("desiredvCpus", 0)
+
+                    if desired > 0:
+                        # Rough estimate: divide by 2 for node count
+                        nodes = max(1, desired // 2)
+                        total_instances += nodes
+
+                        if self.collect_details:
+                            details.append({
                                 "name": env["computeEnvironmentName"],
                                 "vcpus": desired,
                                 "estimated_nodes": nodes,
                             })
 
-                if total_instances > 0:
-                    self.results["batch"][region] = total_instances
-                    self._log(f"  {region}: ~{total_instances} Batch compute nodes", "success")
+            if total_instances > 0:
+                self._log(f"  {region}: ~{total_instances} Batch compute nodes", "success")
+            return total_instances, details
 
-            except ClientError as e:
-                if e.response["Error"]["Code"] != "AccessDeniedException":
-                    self._log(f"  {region}: Error - {e}", "error")
-            except Exception as e:
-                self._log(f"  {region}: Unexpected error - {e}", "error")
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "AccessDeniedException":
+                self._log(f"  {region}: Error - {e}", "error")
+        except Exception as e:
+            self._log(f"  {region}: Unexpected error - {e}", "error")
+        return None
 
-    def count_all(self):
-        """Count all compute resources."""
+    def print_header(self):
+        """Print scan banner to console."""
         print(f"\n{Fore.CYAN}{'='*80}{Style.RESET_ALL}")
         print(f"{Fore.CYAN}Starting AWS Compute Node Count{Style.RESET_ALL}")
         print(f"{Fore.CYAN}Scanning {len(self.regions)} regions...{Style.RESET_ALL}")
         print(f"{Fore.CYAN}{'='*80}{Style.RESET_ALL}\n")
 
-        self.count_ec2_instances()
-        self.count_eks_nodes()
-        self.count_ecs_tasks()
-        self.count_lambda_functions()
-        self.count_lightsail_instances()
-        self.count_batch_compute()
+    def count_methods(self):
+        """Map each resource type to the method that counts it."""
+        return {
+            "ec2": self.count_ec2_instances,
+            "eks": self.count_eks_nodes,
+            "ecs": self.count_ecs_tasks,
+            "lambda": self.count_lambda_functions,
+            "lightsail": self.count_lightsail_instances,
+            "batch": self.count_batch_compute,
+        }
+
+    def count_all(self, resources=None):
+        """
+        Count compute resources, running the services concurrently.
+
+        Args:
+            resources: Resource types to count (None for all); unknown types are ignored
+        """
+        count_methods = self.count_methods()
+        if resources:
+            count_methods = {r: count_methods[r] for r in resources if r in count_methods}
+        if not count_methods:
+            return
+
+        if self.cache_ttl > 0:
+            # Key the cache before the services start, rather than on each service's first call
+            self._account_id()
+
+        # Services get their own pool; their regions fan out on self._executor
+        with ThreadPoolExecutor(max_workers=len(count_methods)) as executor:
+            for future in [executor.submit(method) for method in count_methods.values()]:
+                future.result()
 
     def get_summary(self):
         """Generate summary statistics."""
@@ -301,14 +652,15 @@ class AWSComputeCounter:
         }
 
         for resource_key, resource_name in resource_types.items():
-            if resource_key in self.results:
-                total = sum(self.results[resource_key].values())
-                regions = self.results[resource_key]
-
-                # Format region details
-                region_str = ", ".join([f"{r} ({c})" for r, c in sorted(regions.items())])
+            if resource_key in self._totals:
+                # Format region details (self.regions is already sorted)
+                region_str = ", ".join(
+                    f"{r} ({self.results[(resource_key, r)]})"
+                    for r in self.regions
+                    if (resource_key, r) in self.results
+                )
 
-                summary.append([resource_name, total, region_str])
+                summary.append([resource_name, self._totals[resource_key], region_str])
 
         return summary
 
@@ -332,37 +684,64 @@ class AWSComputeCounter:
         print(f"{Fore.GREEN}Total Compute Nodes: {total:,}{Style.RESET_ALL}")
         print(f"{Fore.GREEN}{'='*80}{Style.RESET_ALL}\n")
 
-    def export_json(self, output_file):
-        """Export results to JSON format."""
-        data = {
-            "timestamp": datetime.utcnow().isoformat(),
+    def to_dict(self):
+        """Return results as a JSON-serializable dict."""
+        results = _nest(self.results)
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
             "provider": "aws",
-            "summary": {
-                resource: sum(regions.values())
-                for resource, regions in self.results.items()
-            },
-            "details": dict(self.results),
-            "region_details": dict(self.region_details),
+            "summary": dict(self._totals),
+            "details": results,
+            "region_details": _nest(self.region_details),
         }
 
-        with open(output_file, "w") as f:
-            json.dump(data, f, indent=2)
+    def export_json(self, output_file):
+        """Export results to JSON format."""
+        data = self.to_dict()
+
+        with open(output_file, "wb") as f:
+            f.write(_json_bytes(data))
 
         print(f"{Fore.GREEN}Results exported to {output_file}{Style.RESET_ALL}")
 
     def export_csv(self, output_file):
         """Export results to CSV format."""
-        with open(output_file, "w", newline="") as f:
+        with open(output_file, "w", newline="", buffering=1 << 20) as f:
             writer = csv.writer(f)
             writer.writerow(["Resource Type", "Region", "Count"])
-
-            for resource, regions in self.results.items():
-                for region, count in regions.items():
-                    writer.writerow([resource, region, count])
+            writer.writerows(
+                (resource, region, count) for (resource, region), count in self.results.items()
+            )
 
         print(f"{Fore.GREEN}Results exported to {output_file}{Style.RESET_ALL}")
 
 
+def run(regions=None, verbose=False, session=None, collect_details=True, use_resource_explorer=False,
+        cache_ttl=0, max_workers=MAX_WORKERS):
+    """
+    Count all AWS compute resources and return the results.
+
+    Used by all_clouds.py to run the counter in-process.
+
+    Args:
+        regions: List of AWS regions to query (None for all regions)
+        verbose: Enable verbose logging
+        session: Optional shared boto3.Session
+        collect_details: Record per-resource details (False counts only)
+        use_resource_explorer: Count EC2 instances with AWS Resource Explorer
+        cache_ttl: Seconds to reuse cached per-region results (0 disables the cache)
+        max_workers: Threads used to scan regions
+
+    Returns:
+        Results dict in the same shape as the JSON export
+    """
+    with AWSComputeCounter(regions=regions, verbose=verbose, session=session,
+                           collect_details=collect_details, use_resource_explorer=use_resource_explorer,
+                           cache_ttl=cache_ttl, max_workers=max_workers) as counter:
+        counter.count_all()
+        return counter.to_dict()
+
+
 @click.command()
 @click.option(
     "--regions",
@@ -391,7 +770,30 @@ class AWSComputeCounter:
     help="Comma-separated list of resources to count (ec2,eks,ecs,lambda,lightsail,batch)",
     default="ec2,eks,ecs,lambda,lightsail,batch",
 )
-def main(regions, output, output_format, verbose, resources):
+@click.option(
+    "--details/--no-details",
+    default=True,
+    help="Record per-resource details for the JSON export (--no-details only counts)",
+)
+@click.option(
+    "--resource-explorer",
+    is_flag=True,
+    help="Count EC2 instances with one AWS Resource Explorer search (falls back to a region scan)",
+)
+@click.option(
+    "--cache-ttl",
+    type=click.IntRange(min=0),
+    help="Seconds to reuse cached per-region results (default: 0, no caching)",
+    default=0,
+)
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    help=f"Threads used to scan regions concurrently (default: {MAX_WORKERS})",
+    default=MAX_WORKERS,
+)
+def main(regions, output, output_format, verbose, resources, details, resource_explorer, cache_ttl,
+         max_workers):
     """
     Count all compute nodes across AWS services.
 
@@ -408,35 +810,26 @@ def main(regions, output, output_format, verbose, resources):
         resource_list = [r.strip() for r in resources.split(",")]
 
         # Initialize counter
-        counter = AWSComputeCounter(regions=region_list, verbose=verbose)
-
-        # Count resources based on filter
-        if "ec2" in resource_list:
-            counter.count_ec2_instances()
-        if "eks" in resource_list:
-            counter.count_eks_nodes()
-        if "ecs" in resource_list:
-            counter.count_ecs_tasks()
-        if "lambda" in resource_list:
-            counter.count_lambda_functions()
-        if "lightsail" in resource_list:
-            counter.count_lightsail_instances()
-        if "batch" in resource_list:
-            counter.count_batch_compute()
-
-        # If no filters, count all
-        if resources == "ec2,eks,ecs,lambda,lightsail,batch":
-            counter.count_all()
-
-        # Print summary
-        counter.print_summary()
-
-        # Export if requested
-        if output:
-            if output_format == "json":
-                counter.export_json(output)
-            elif output_format == "csv":
-                counter.export_csv(output)
+        with AWSComputeCounter(regions=region_list, verbose=verbose, collect_details=details,
+                               use_resource_explorer=resource_explorer, cache_ttl=cache_ttl,
+                               max_workers=max_workers) as counter:
+            counter.print_header()
+
+            # Count the selected resources (each exactly once)
+            unknown = [r for r in resource_list if r not in counter.count_methods()]
+            if unknown:
+                print(f"{Fore.YELLOW}Ignoring unknown resource type(s): {', '.join(unknown)}{Style.RESET_ALL}")
+            counter.count_all(resources=resource_list)
+
+            # Print summary
+            counter.print_summary()
+
+            # Export if requested
+            if output:
+                if output_format == "json":
+                    counter.export_json(output)
+                elif output_format == "csv":
+                    counter.export_csv(output)
 
     except (NoCredentialsError, PartialCredentialsError):
         print(f"\n{Fore.RED}Error: AWS credentials not found.{Style.RESET_ALL}")
@@ -448,7 +841,6 @@ def main(regions, output, output_format, verbose, resources):
     except Exception as e:
         print(f"\n{Fore.RED}Error: {e}{Style.RESET_ALL}")
         if verbose:
-            import traceback
             traceback.print_exc()
         sys.exit(1)
 
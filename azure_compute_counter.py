@@ -6,82 +6,422 @@ Counts all compute resources across Azure including Virtual Machines, AKS nodes,
 Container Instances, Azure Functions, VM Scale Sets, and Batch pools.
 """
 
+import base64
 import json
 import csv
+import hashlib
+import os
 import sys
-from collections import defaultdict
-from datetime import datetime
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
 import click
+import requests
 from azure.identity import DefaultAzureCredential, AzureCliCredential
 from azure.mgmt.compute import ComputeManagementClient
 from azure.mgmt.containerinstance import ContainerInstanceManagementClient
 from azure.mgmt.containerservice import ContainerServiceClient
-from azure.mgmt.web import WebSiteManagementClient
 from azure.mgmt.batch import BatchManagementClient
-from azure.mgmt.resource import SubscriptionClient
+from azure.mgmt.resource import ResourceManagementClient, SubscriptionClient
 from azure.core.exceptions import HttpResponseError, ClientAuthenticationError
+from azure.mgmt.core.tools import parse_resource_id
+from azure.core.pipeline.policies import RetryPolicy, CustomHookPolicy
+from azure.core.rest import HttpRequest
+from azure.mgmt.core import ARMPipelineClient
+from azure.mgmt.core.policies import ARMChallengeAuthenticationPolicy
+from azure.core.pipeline.transport import RequestsTransport
 from tabulate import tabulate
 from colorama import init, Fore, Style
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; only needed for Parquet export
+    pa = None
+
 # Initialize colorama
 init(autoreset=True)
 
+# Upper bound on subscriptions queried at once, to stay clear of ARM throttling
+MAX_WORKERS = 32
+
+# Throttled (429) and transient failures are retried with exponential backoff, honouring
+# Retry-After, rather than dropping the subscription's count on the first error
+RETRY_TOTAL = 5
+RETRY_BACKOFF_FACTOR = 1.0
+RETRY_BACKOFF_MAX = 30
+
+# Seconds between polls of long-running operations; the SDK default follows Retry-After (often 30 s+)
+DEFAULT_POLL_INTERVAL = 5
+
+# The subscription list, and per-subscription results when --cache-ttl is set, are cached here
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "csp-scripts", "azure")
+SUBSCRIPTION_CACHE_TTL = 2 * 60 * 60
+
+# Resource provider namespace each resource type needs registered in a subscription
+RESOURCE_PROVIDERS = {
+    "vms": "microsoft.compute",
+    "vmss": "microsoft.compute",
+    "aks": "microsoft.containerservice",
+    "aci": "microsoft.containerinstance",
+    "functions": "microsoft.web",
+    "batch": "microsoft.batch",
+}
+
+# Per-resource details are stored as parallel column lists rather than one dict per resource
+DETAIL_COLUMNS = {
+    "vms": ("name", "location", "size", "status"),
+    "aks": ("cluster", "pool", "nodes", "vm_size"),
+    "aci": ("name", "location", "containers", "state"),
+    "functions": ("name", "location", "provisioning_state", "kind"),
+    "vmss": ("name", "location", "instances", "vm_size"),
+    "batch": ("account", "pool", "dedicated_nodes", "low_priority_nodes"),
+}
+
+
+def _json_bytes(data):
+    """Serialize data to indented JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+
+def _write_json_member(f, key, value, depth=1, last=False):
+    """Write one '"key": value' member of an indented JSON object to a binary file."""
+    indent = b"  " * depth
+    f.write(indent + _json_bytes(key) + b": " + _json_bytes(value).replace(b"\n", b"\n" + indent))
+    f.write(b"\n" if last else b",\n")
+
+
+def _found(by_resource):
+    """Drop resource types with no subscriptions from a resource-keyed dict."""
+    return {resource: subs for resource, subs in by_resource.items() if subs}
+
+
+def _detail_rows(columns):
+    """Transpose parallel column lists back into one dict per resource."""
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+
+# ARM $batch folds up to ARM_BATCH_SIZE list calls (one per subscription) into one request
+ARM_ENDPOINT = "https://management.azure.com"
+ARM_BATCH_SIZE = 20
+
+
+def _vms_from_arm(items):
+    """Count raw ARM virtual machine resources, returning (count, details)."""
+    details = {
+        "name": [vm["name"] for vm in items],
+        "location": [vm["location"] for vm in items],
+        "size": [vm.get("properties", {}).get("hardwareProfile", {}).get("vmSize") for vm in items],
+        "status": ["running"] * len(items),  # Would need instance view for actual status
+    }
+    return len(items), details
+
+
+def _aks_from_arm(items):
+    """Count nodes in raw ARM managed cluster resources, returning (count, details)."""
+    pools = [
+        (cluster["name"], pool)
+        for cluster in items
+        for pool in cluster.get("properties", {}).get("agentPoolProfiles") or []
+    ]
+    details = {
+        "cluster": [cluster_name for cluster_name, _ in pools],
+        "pool": [pool.get("name") for _, pool in pools],
+        "nodes": [pool.get("count") or 0 for _, pool in pools],
+        "vm_size": [pool.get("vmSize") for _, pool in pools],
+    }
+    return sum(details["nodes"]), details
+
+
+def _vmss_from_arm(items):
+    """Count instances in raw ARM scale set resources, returning (count, details)."""
+    details = {
+        "name": [vmss["name"] for vmss in items],
+        "location": [vmss["location"] for vmss in items],
+        "instances": [vmss.get("sku", {}).get("capacity") or 0 for vmss in items],
+        "vm_size": [vmss.get("sku", {}).get("name") for vmss in items],
+    }
+    return sum(details["instances"]), details
+
+
+# Resource types listed through ARM $batch: list path under the subscription and raw-resource parser
+ARM_BATCH_LISTS = {
+    "vms": ("/providers/Microsoft.Compute/virtualMachines?api-version=2023-03-01", _vms_from_arm),
+    "aks": ("/providers/Microsoft.ContainerService/managedClusters?api-version=2023-08-01", _aks_from_arm),
+    "vmss": (
+        "/resources?$filter=resourceType%20eq%20'Microsoft.Compute/virtualMachineScaleSets'&api-version=2021-04-01",
+        _vmss_from_arm,
+    ),
+}
+
+
+def credential_identity(credential):
+    """
+    Get the "tenant|object" IDs of the identity a credential signs in as.
+
+    Read from the tid and oid claims of an ARM access token (also used by
+    all_clouds.py). Raises if a token cannot be fetched or lacks the claims.
+    """
+    payload = credential.get_token(f"{ARM_ENDPOINT}/.default").token.split(".")[1]
+    claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    return f"{claims['tid']}|{claims['oid']}"
+
+
+def _cache_flag(entry):
+    """Summary suffix for a subscription count served from the results cache."""
+    if entry is None:
+        return ""
+    return ", stale" if entry["stale"] else ", cached"
+
+
+class _CachedTokenCredential:
+    """
+    Credential wrapper that reuses each access token until shortly before it expires.
+
+    Every SDK client asks the credential for its own token, and credentials such
+    as AzureCliCredential start a subprocess per request. Wrapping the credential
+    once means all clients share a single token per scope.
+    """
+
+    # Fetch a new token this many seconds before the cached one expires
+    REFRESH_MARGIN = 300
+
+    def __init__(self, credential):
+        self.credential = credential
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get_token(self, *scopes, **kwargs):
+        """Get a token for the scopes, from the cache while it is still valid."""
+        if kwargs.get("claims"):
+            # Claims challenges need a fresh token
+            return self.credential.get_token(*scopes, **kwargs)
+
+        key = (scopes, kwargs.get("tenant_id"))
+        # Held while fetching, so concurrent clients wait for one token instead of each fetching
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is None or token.expires_on - self.REFRESH_MARGIN < time.time():
+                token = self._tokens[key] = self.credential.get_token(*scopes, **kwargs)
+        return token
+
 
 class AzureComputeCounter:
     """Count compute resources across Azure services."""
 
-    def __init__(self, subscription_id=None, verbose=False):
+    _LOG_COLORS = {
+        "info": Fore.CYAN,
+        "success": Fore.GREEN,
+        "warning": Fore.YELLOW,
+        "error": Fore.RED,
+    }
+
+    def __init__(self, subscription_id=None, verbose=False, credential=None, refresh_subscriptions=False,
+                 cache_ttl=0, arm_batch=False, poll_interval=DEFAULT_POLL_INTERVAL, max_workers=MAX_WORKERS):
         """
         Initialize Azure compute counter.
 
         Args:
             subscription_id: Azure subscription ID (None for all subscriptions)
             verbose: Enable verbose logging
+            credential: Optional pre-built Azure credential (skips credential discovery)
+            refresh_subscriptions: Ignore the cached subscription list and fetch it again
+            cache_ttl: Seconds to reuse cached per-subscription results (0 disables the cache)
+            arm_batch: List VMs, AKS clusters and scale sets for many subscriptions per
+                request through the ARM $batch endpoint
+            poll_interval: Seconds between polls of long-running operations on SDK clients
+            max_workers: Threads querying subscriptions at once; also sizes the HTTP connection pool
         """
         self.verbose = verbose
         self.subscription_id = subscription_id
+        self.cache_ttl = cache_ttl
+        self.arm_batch = arm_batch
+        self.poll_interval = poll_interval
         self.subscriptions = []
-        self.results = defaultdict(lambda: defaultdict(int))
-        self.subscription_details = defaultdict(lambda: defaultdict(list))
-
-        # Initialize credentials
-        try:
-            self.credential = DefaultAzureCredential()
-            # Test credential
-            subscription_client = SubscriptionClient(self.credential)
-            list(subscription_client.subscriptions.list())
-        except Exception:
-            # Fall back to Azure CLI credential
-            self._log("Falling back to Azure CLI credentials", "warning")
-            self.credential = AzureCliCredential()
+        # resource -> subscription name -> count, for subscriptions with any
+        self.results = {resource: {} for resource in DETAIL_COLUMNS}
+        # resource -> subscription name -> {column: [values]}, see DETAIL_COLUMNS
+        self.subscription_details = {resource: {} for resource in DETAIL_COLUMNS}
+        # resource -> subscription name -> {"cached_at", "stale"}, for results read from the cache
+        self.cached_results = {resource: {} for resource in DETAIL_COLUMNS}
+        # One pool bounds in-flight subscription calls across all resource types;
+        # the lock guards results and details while those types run concurrently
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Separate pool for nested Batch pool listings, so subscription tasks never wait on their own pool
+        self._account_executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._clients = {}
+        # Registered provider namespaces per subscription, looked up once each when
+        # several resource types are counted (see count_all)
+        self._check_providers = False
+        self._providers = {}
+        self._provider_locks = {}
+
+        # All SDK clients share one HTTP session so connections are reused across
+        # clients; the pool is sized for the subscription threads
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self._session.mount("https://", adapter)
+        self.transport = RequestsTransport(session=self._session, session_owner=False)
+        self._retry_policy = RetryPolicy(
+            retry_total=RETRY_TOTAL,
+            retry_backoff_factor=RETRY_BACKOFF_FACTOR,
+            retry_backoff_max=RETRY_BACKOFF_MAX,
+        )
+
+        # Initialize credentials. The default chain is not probed up front: listing
+        # subscriptions is the first call, and it falls back to Azure CLI credentials
+        # if the chain cannot authenticate. Tokens are cached and shared by all clients.
+        self._cli_fallback = credential is None
+        self.credential = _CachedTokenCredential(credential if credential is not None else DefaultAzureCredential())
+        self._identity = None
+
+        # Subscriptions listed by a recent run as the same identity are reused from disk
+        cached_subscriptions = None
+        if not subscription_id and not refresh_subscriptions:
+            cached_subscriptions = self._load_subscription_cache()
+
+        if cached_subscriptions is not None:
+            self.subscriptions = cached_subscriptions
+            self._log(f"Using {len(self.subscriptions)} cached subscriptions (--refresh-subs to re-list)", "info")
+        else:
+            try:
+                self._get_subscriptions()
+            except Exception:
+                self.close()
+                raise
 
-        self._get_subscriptions()
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the shared HTTP session and the worker pool."""
+        self._executor.shutdown(wait=False)
+        self._account_executor.shutdown(wait=False)
+        self._session.close()
+
+    def _client(self, client_class, sub_id):
+        """Get the cached SDK client of a class for a subscription, creating it on first use."""
+        key = (client_class, sub_id)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = client_class(
+                        self.credential,
+                        sub_id,
+                        transport=self.transport,
+                        polling_interval=self.poll_interval,
+                        retry_policy=self._retry_policy,
+                        raw_response_hook=self._log_throttled,
+                    )
+        return client
+
+    def _log_throttled(self, response):
+        """Response hook that reports each throttled (429) ARM response before it is retried."""
+        http_response = response.http_response
+        if http_response.status_code == 429:
+            retry_after = http_response.headers.get("Retry-After", "?")
+            self._log(f"  Throttled by ARM on {response.http_request.url} (retry after {retry_after}s)", "warning")
 
     def _log(self, message, level="info"):
         """Log message if verbose mode is enabled."""
-        if self.verbose:
-            colors = {
-                "info": Fore.CYAN,
-                "success": Fore.GREEN,
-                "warning": Fore.YELLOW,
-                "error": Fore.RED,
-            }
-            print(f"{colors.get(level, '')}{message}{Style.RESET_ALL}")
+        if not self.verbose:
+            return
+
+        # One write per line, so lines from concurrent subscription threads don't interleave
+        sys.stdout.write(f"{self._LOG_COLORS.get(level, '')}{message}{Style.RESET_ALL}\n")
+
+    def _identity_key(self):
+        """
+        Get a short key for the identity the credential signs in as, or None if unknown.
+
+        The key hashes the tenant (tid) and object (oid) claims of an ARM token, so
+        cached subscriptions and results are never shared between users, service
+        principals or tenants. Without a key, the caches are skipped.
+        """
+        if self._identity is None:
+            try:
+                identity = credential_identity(self.credential)
+            except Exception as e:
+                self._log(f"Could not determine the signed-in identity, not caching: {e}", "warning")
+                identity = None
+            self._identity = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:12] if identity else ""
+        return self._identity or None
+
+    def _subscription_cache_path(self):
+        """Get the subscription cache file for the signed-in identity, or None if it is unknown."""
+        key = self._identity_key()
+        return os.path.join(CACHE_DIR, f"subscriptions-{key}.json") if key else None
+
+    def _load_subscription_cache(self):
+        """Load the cached subscription list, or None if missing, unreadable or expired."""
+        path = self._subscription_cache_path()
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                entry = json.loads(f.read())
+            if time.time() - entry["ts"] < SUBSCRIPTION_CACHE_TTL:
+                return entry["subs"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _save_subscription_cache(self):
+        """Atomically write the subscription list to the cache."""
+        path = self._subscription_cache_path()
+        if path is None:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"ts": time.time(), "subs": self.subscriptions}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self._log(f"Could not write subscription cache {path}: {e}", "warning")
+
+    def _list_subscriptions(self):
+        """List all subscriptions, switching to Azure CLI credentials if the default chain fails."""
+        try:
+            return list(SubscriptionClient(self.credential, transport=self.transport).subscriptions.list())
+        except ClientAuthenticationError:
+            if not self._cli_fallback:
+                raise
+            self._log("Falling back to Azure CLI credentials", "warning")
+            self.credential = _CachedTokenCredential(AzureCliCredential())
+            self._identity = None
+            return list(SubscriptionClient(self.credential, transport=self.transport).subscriptions.list())
 
     def _get_subscriptions(self):
         """Get list of Azure subscriptions."""
         try:
-            subscription_client = SubscriptionClient(self.credential)
-
             if self.subscription_id:
-                # Use specific subscription
-                self.subscriptions = [{"id": self.subscription_id, "name": "Specified Subscription"}]
-                self._log(f"Using subscription: {self.subscription_id}", "info")
+                # Fetch just the specified subscription for its display name
+                sub = SubscriptionClient(self.credential, transport=self.transport).subscriptions.get(
+                    self.subscription_id
+                )
+                self.subscriptions = [{"id": sub.subscription_id, "name": sub.display_name}]
+                self._log(f"Using subscription: {sub.display_name} ({self.subscription_id})", "info")
             else:
                 # Get all subscriptions
                 self.subscriptions = []
-                for sub in subscription_client.subscriptions.list():
+                for sub in self._list_subscriptions():
                     if sub.state == "Enabled":
                         self.subscriptions.append({
                             "id": sub.subscription_id,
@@ -89,6 +429,7 @@ class AzureComputeCounter:
                         })
 
                 self._log(f"Found {len(self.subscriptions)} enabled subscriptions", "success")
+                self._save_subscription_cache()
 
         except Exception as e:
             self._log(f"Error getting subscriptions: {e}", "error")
@@ -97,228 +438,539 @@ class AzureComputeCounter:
             else:
                 raise
 
+    def _registered_providers(self, subscription):
+        """
+        Get the resource provider namespaces registered in a subscription (lowercased).
+
+        Looked up once per subscription even when resource types run concurrently.
+        Returns None if the lookup fails, meaning nothing is skipped.
+        """
+        sub_id = subscription["id"]
+        with self._lock:
+            lock = self._provider_locks.setdefault(sub_id, threading.Lock())
+
+        with lock:
+            if sub_id not in self._providers:
+                try:
+                    resource_client = self._client(ResourceManagementClient, sub_id)
+                    self._providers[sub_id] = {
+                        provider.namespace.lower()
+                        for provider in resource_client.providers.list()
+                        if provider.registration_state == "Registered"
+                    }
+                except Exception as e:
+                    self._log(f"  {subscription['name']}: Could not list resource providers - {e}", "warning")
+                    self._providers[sub_id] = None
+            return self._providers[sub_id]
+
+    def _registered(self, resource, count_subscription):
+        """
+        Wrap a per-subscription count function to skip subscriptions where the
+        resource type's provider is not registered, which cannot contain any.
+        """
+        if not self._check_providers or resource not in RESOURCE_PROVIDERS:
+            return count_subscription
+
+        namespace = RESOURCE_PROVIDERS[resource]
+
+        def registered_count_subscription(subscription):
+            providers = self._registered_providers(subscription)
+            if providers is not None and namespace not in providers:
+                return 0, {column: [] for column in DETAIL_COLUMNS[resource]}
+            return count_subscription(subscription)
+
+        return registered_count_subscription
+
+    def _arm_client(self):
+        """
+        Get a client for raw ARM requests with the same pipeline as the SDK clients.
+
+        Requests share the HTTP session and retry policy, and throttled responses
+        are logged by the same hook.
+        """
+        return ARMPipelineClient(
+            ARM_ENDPOINT,
+            transport=self.transport,
+            policies=[
+                self._retry_policy,
+                ARMChallengeAuthenticationPolicy(self.credential, f"{ARM_ENDPOINT}/.default"),
+                CustomHookPolicy(raw_response_hook=self._log_throttled),
+            ],
+        )
+
+    def _arm_get_json(self, client, request):
+        """
+        Send a raw ARM request and return its JSON body.
+
+        A 202 Accepted response means ARM is still working on the request; its
+        Location is polled until the result is ready.
+        """
+        response = client.send_request(request)
+        while response.status_code == 202:
+            location = response.headers["Location"]
+            time.sleep(int(response.headers.get("Retry-After", self.poll_interval)))
+            response = client.send_request(HttpRequest("GET", location))
+        response.raise_for_status()
+        return response.json()
+
+    def _batch_list(self, path):
+        """
+        List one resource type in every subscription through ARM $batch requests.
+
+        Subscriptions are sent ARM_BATCH_SIZE at a time; further pages of a
+        subscription's listing are followed with plain GETs.
+
+        Args:
+            path: List path relative to /subscriptions/<id>, including api-version
+
+        Returns:
+            Dict mapping subscription ID to its raw resource dicts. Subscriptions
+            whose listing failed or could not be read are left out.
+        """
+        client = self._arm_client()
+        listed = {}
+        for start in range(0, len(self.subscriptions), ARM_BATCH_SIZE):
+            chunk = self.subscriptions[start:start + ARM_BATCH_SIZE]
+            body = {
+                "requests": [
+                    {"httpMethod": "GET", "name": sub["id"], "relativeUrl": f"/subscriptions/{sub['id']}{path}"}
+                    for sub in chunk
+                ]
+            }
+            batch = self._arm_get_json(
+                client, HttpRequest("POST", f"{ARM_ENDPOINT}/batch?api-version=2020-06-01", json=body)
+            )
+
+            for entry in batch.get("responses", []):
+                try:
+                    if entry.get("httpStatusCode") != 200:
+                        continue
+                    content = entry.get("content") or {}
+                    items = list(content.get("value", []))
+                    next_link = content.get("nextLink")
+                    while next_link:
+                        page = self._arm_get_json(client, HttpRequest("GET", next_link))
+                        items.extend(page.get("value", []))
+                        next_link = page.get("nextLink")
+                    listed[entry["name"]] = items
+                except Exception as e:
+                    # The subscription is listed on its own instead
+                    self._log(f"  Could not read ARM batch response: {e}", "warning")
+
+        return listed
+
+    def _batched(self, resource, count_subscription):
+        """
+        Wrap a per-subscription count function so it reads from one ARM $batch listing.
+
+        The listing runs on the first call and covers every subscription. Subscriptions
+        it could not list are counted with count_subscription as usual.
+        """
+        if not self.arm_batch or resource not in ARM_BATCH_LISTS:
+            return count_subscription
+
+        path, parse = ARM_BATCH_LISTS[resource]
+        listed = None
+        listed_lock = threading.Lock()
+
+        def batched_count_subscription(subscription):
+            nonlocal listed
+            with listed_lock:
+                if listed is None:
+                    try:
+                        listed = self._batch_list(path)
+                    except Exception as e:
+                        self._log(f"  ARM batch listing of {resource} failed, listing per subscription: {e}", "warning")
+                        listed = {}
+
+            items = listed.get(subscription["id"])
+            if items is None:
+                return count_subscription(subscription)
+
+            try:
+                count, details = parse(items)
+            except (KeyError, TypeError, AttributeError) as e:
+                self._log(f"  {subscription['name']}: Unexpected ARM batch {resource} listing, "
+                          f"listing on its own - {e!r}", "warning")
+                return count_subscription(subscription)
+            if count > 0:
+                self._log(f"  {subscription['name']}: {count} {resource}", "success")
+            return count, details
+
+        return batched_count_subscription
+
+    def _cached(self, resource, count_subscription, identity):
+        """
+        Wrap a per-subscription count function with the on-disk results cache.
+
+        Entries live at CACHE_DIR/<identity>/<subscription>/<resource>.json and are reused while
+        younger than cache_ttl seconds. If the API call fails, an expired entry is
+        served instead. Either way the subscription is recorded in cached_results,
+        so the summary and exports flag it. Failed subscriptions are not cached.
+        """
+        def cached_count_subscription(subscription):
+            path = os.path.join(CACHE_DIR, identity, subscription["id"], f"{resource}.json")
+            cached = None
+            try:
+                with open(path, "rb") as f:
+                    cached = json.loads(f.read())
+                if not isinstance(cached["details"], dict):
+                    cached = None  # Written before details were stored as columns
+                elif time.time() - cached["ts"] < self.cache_ttl:
+                    self._log(f"  {subscription['name']}: using cached {resource} results", "info")
+                    self._record_cached(resource, subscription, cached["ts"], stale=False)
+                    return cached["count"], cached["details"]
+            except (OSError, ValueError, KeyError, TypeError):
+                cached = None
+
+            result = count_subscription(subscription)
+            if result is None:
+                if cached is not None:
+                    self._log(f"  {subscription['name']}: serving stale cached {resource} results", "warning")
+                    self._record_cached(resource, subscription, cached["ts"], stale=True)
+                    return cached["count"], cached["details"]
+                return None
+
+            count, details = result
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                payload = json.dumps({"ts": time.time(), "count": count, "details": details})
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+            except (OSError, TypeError) as e:
+                self._log(f"  Could not write cache file {path}: {e}", "warning")
+            return result
+
+        return cached_count_subscription
+
+    def _record_cached(self, resource, subscription, ts, stale):
+        """Note that a subscription's results for a resource type came from the cache."""
+        cached_at = datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="seconds")
+        with self._lock:
+            self.cached_results[resource][subscription["name"]] = {"cached_at": cached_at, "stale": stale}
+
+    def _run_subscriptions(self, resource, count_subscription):
+        """
+        Count one resource type in every subscription concurrently and merge the results.
+
+        Results are merged in subscription order, under the lock since several
+        resource types may be counted at once.
+
+        Args:
+            resource: Results key for the resource type
+            count_subscription: Callable taking a subscription dict and returning
+                (count, details), or None if the subscription could not be counted
+        """
+        count_subscription = self._registered(resource, count_subscription)
+        count_subscription = self._batched(resource, count_subscription)
+        identity = self._identity_key() if self.cache_ttl > 0 else None
+        if identity:
+            count_subscription = self._cached(resource, count_subscription, identity)
+
+        results = self._executor.map(count_subscription, self.subscriptions)
+        for subscription, result in zip(self.subscriptions, results):
+            if result is None:
+                continue
+
+            count, details = result
+            sub_name = subscription["name"]
+            with self._lock:
+                if any(details.values()):
+                    existing = self.subscription_details[resource].get(sub_name)
+                    if existing is None:
+                        self.subscription_details[resource][sub_name] = details
+                    else:
+                        for column, values in details.items():
+                            existing[column].extend(values)
+                if count > 0:
+                    self.results[resource][sub_name] = count
+
     def count_virtual_machines(self):
         """Count Virtual Machines across all subscriptions."""
         self._log("Counting Virtual Machines...", "info")
+        self._run_subscriptions("vms", self._count_vms_for_sub)
 
-        for subscription in self.subscriptions:
-            sub_id = subscription["id"]
-            sub_name = subscription["name"]
+    def _count_vms_for_sub(self, subscription):
+        """Count Virtual Machines in one subscription."""
+        sub_id = subscription["id"]
+        sub_name = subscription["name"]
 
-            try:
-                compute_client = ComputeManagementClient(self.credential, sub_id)
-
-                count = 0
-                for vm in compute_client.virtual_machines.list_all():
-                    count += 1
-                    self.subscription_details["vms"][sub_name].append({
-                        "name": vm.name,
-                        "location": vm.location,
-                        "size": vm.hardware_profile.vm_size,
-                        "status": "running",  # Would need instance view for actual status
-                    })
+        try:
+            compute_client = self._client(ComputeManagementClient, sub_id)
+
+            names, locations, sizes = [], [], []
+            for vm in compute_client.virtual_machines.list_all():
+                names.append(vm.name)
+                locations.append(vm.location)
+                sizes.append(vm.hardware_profile.vm_size)
+
+            count = len(names)
+            details = {
+                "name": names,
+                "location": locations,
+                "size": sizes,
+                "status": ["running"] * count,  # Would need instance view for actual status
+            }
 
-                if count > 0:
-                    self.results["vms"][sub_name] = count
-                    self._log(f"  {sub_name}: {count} VMs", "success")
+            if count > 0:
+                self._log(f"  {sub_name}: {count} VMs", "success")
+            return count, details
 
-            except HttpResponseError as e:
-                self._log(f"  {sub_name}: Error - {e.message}", "error")
-            except Exception as e:
-                self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        except HttpResponseError as e:
+            self._log(f"  {sub_name}: Error - {e.message}", "error")
+        except Exception as e:
+            self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        return None
 
     def count_aks_nodes(self):
         """Count AKS cluster nodes across all subscriptions."""
         self._log("Counting AKS nodes...", "info")
+        self._run_subscriptions("aks", self._count_aks_for_sub)
 
-        for subscription in self.subscriptions:
-            sub_id = subscription["id"]
-            sub_name = subscription["name"]
+    def _count_aks_for_sub(self, subscription):
+        """Count AKS cluster nodes in one subscription."""
+        sub_id = subscription["id"]
+        sub_name = subscription["name"]
 
-            try:
-                container_client = ContainerServiceClient(self.credential, sub_id)
-
-                total_nodes = 0
-                for cluster in container_client.managed_clusters.list():
-                    if cluster.agent_pool_profiles:
-                        for pool in cluster.agent_pool_profiles:
-                            node_count = pool.count or 0
-                            total_nodes += node_count
-
-                            self.subscription_details["aks"][sub_name].append({
-                                "cluster": cluster.name,
-                                "pool": pool.name,
-                                "nodes": node_count,
-                                "vm_size": pool.vm_size,
-                            })
-
-                if total_nodes > 0:
-                    self.results["aks"][sub_name] = total_nodes
-                    self._log(f"  {sub_name}: {total_nodes} AKS nodes", "success")
-
-            except HttpResponseError as e:
-                if "NotFound" not in str(e):
-                    self._log(f"  {sub_name}: Error - {e.message}", "error")
-            except Exception as e:
-                self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        try:
+            container_client = self._client(ContainerServiceClient, sub_id)
+
+            clusters, pools, nodes, vm_sizes = [], [], [], []
+            for cluster in container_client.managed_clusters.list():
+                if cluster.agent_pool_profiles:
+                    for pool in cluster.agent_pool_profiles:
+                        clusters.append(cluster.name)
+                        pools.append(pool.name)
+                        nodes.append(pool.count or 0)
+                        vm_sizes.append(pool.vm_size)
+
+            total_nodes = sum(nodes)
+            details = {"cluster": clusters, "pool": pools, "nodes": nodes, "vm_size": vm_sizes}
+
+            if total_nodes > 0:
+                self._log(f"  {sub_name}: {total_nodes} AKS nodes", "success")
+            return total_nodes, details
+
+        except HttpResponseError as e:
+            if "NotFound" not in str(e):
+                self._log(f"  {sub_name}: Error - {e.message}", "error")
+        except Exception as e:
+            self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        return None
 
     def count_container_instances(self):
         """Count Azure Container Instances across all subscriptions."""
         self._log("Counting Container Instances...", "info")
+        self._run_subscriptions("aci", self._count_aci_for_sub)
 
-        for subscription in self.subscriptions:
-            sub_id = subscription["id"]
-            sub_name = subscription["name"]
+    def _count_aci_for_sub(self, subscription):
+        """Count Azure Container Instances in one subscription."""
+        sub_id = subscription["id"]
+        sub_name = subscription["name"]
 
-            try:
-                aci_client = ContainerInstanceManagementClient(self.credential, sub_id)
+        try:
+            aci_client = self._client(ContainerInstanceManagementClient, sub_id)
 
-                count = 0
-                for container_group in aci_client.container_groups.list():
-                    # Each container group can have multiple containers
-                    num_containers = len(container_group.containers) if container_group.containers else 1
-                    count += num_containers
+            names, locations, containers, states = [], [], [], []
+            for container_group in aci_client.container_groups.list():
+                names.append(container_group.name)
+                locations.append(container_group.location)
+                # Each container group can have multiple containers
+                containers.append(len(container_group.containers) if container_group.containers else 1)
+                states.append(container_group.provisioning_state)
 
-                    self.subscription_details["aci"][sub_name].append({
-                        "name": container_group.name,
-                        "location": container_group.location,
-                        "containers": num_containers,
-                        "state": container_group.provisioning_state,
-                    })
+            count = sum(containers)
+            details = {"name": names, "location": locations, "containers": containers, "state": states}
 
-                if count > 0:
-                    self.results["aci"][sub_name] = count
-                    self._log(f"  {sub_name}: {count} Container Instances", "success")
+            if count > 0:
+                self._log(f"  {sub_name}: {count} Container Instances", "success")
+            return count, details
 
-            except HttpResponseError as e:
-                if "NotFound" not in str(e):
-                    self._log(f"  {sub_name}: Error - {e.message}", "error")
-            except Exception as e:
-                self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        except HttpResponseError as e:
+            if "NotFound" not in str(e):
+                self._log(f"  {sub_name}: Error - {e.message}", "error")
+        except Exception as e:
+            self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        return None
 
     def count_azure_functions(self):
         """Count Azure Functions across all subscriptions."""
         self._log("Counting Azure Functions...", "info")
+        self._run_subscriptions("functions", self._count_functions_for_sub)
 
-        for subscription in self.subscriptions:
-            sub_id = subscription["id"]
-            sub_name = subscription["name"]
-
-            try:
-                web_client = WebSiteManagementClient(self.credential, sub_id)
-
-                count = 0
-                for app in web_client.web_apps.list():
-                    # Check if it's a function app
-                    if app.kind and "functionapp" in app.kind.lower():
-                        count += 1
-
-                        self.subscription_details["functions"][sub_name].append({
-                            "name": app.name,
-                            "location": app.location,
-                            "state": app.state,
-                            "kind": app.kind,
-                        })
-
-                if count > 0:
-                    self.results["functions"][sub_name] = count
-                    self._log(f"  {sub_name}: {count} Function Apps", "success")
+    def _count_functions_for_sub(self, subscription):
+        """Count Azure Function Apps in one subscription."""
+        sub_id = subscription["id"]
+        sub_name = subscription["name"]
 
-            except HttpResponseError as e:
-                if "NotFound" not in str(e):
-                    self._log(f"  {sub_name}: Error - {e.message}", "error")
-            except Exception as e:
-                self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        try:
+            resource_client = self._client(ResourceManagementClient, sub_id)
+
+            names, locations, states, kinds = [], [], [], []
+            # Generic resource listing returns only the envelope of each site rather than
+            # its full configuration, so the Running/Stopped state is not available; the
+            # provisioning state is recorded instead. ARM cannot filter on kind, so that
+            # is checked here.
+            sites = resource_client.resources.list(
+                filter="resourceType eq 'Microsoft.Web/sites'", expand="provisioningState"
+            )
+            for app in sites:
+                if app.kind and "functionapp" in app.kind.lower():
+                    names.append(app.name)
+                    locations.append(app.location)
+                    states.append(app.provisioning_state)
+                    kinds.append(app.kind)
+
+            count = len(names)
+            details = {"name": names, "location": locations, "provisioning_state": states, "kind": kinds}
+
+            if count > 0:
+                self._log(f"  {sub_name}: {count} Function Apps", "success")
+            return count, details
+
+        except HttpResponseError as e:
+            if "NotFound" not in str(e):
+                self._log(f"  {sub_name}: Error - {e.message}", "error")
+        except Exception as e:
+            self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        return None
 
     def count_vmss_instances(self):
         """Count VM Scale Set instances across all subscriptions."""
         self._log("Counting VM Scale Set instances...", "info")
+        self._run_subscriptions("vmss", self._count_vmss_for_sub)
 
-        for subscription in self.subscriptions:
-            sub_id = subscription["id"]
-            sub_name = subscription["name"]
+    def _count_vmss_for_sub(self, subscription):
+        """Count VM Scale Set instances in one subscription."""
+        sub_id = subscription["id"]
+        sub_name = subscription["name"]
 
-            try:
-                compute_client = ComputeManagementClient(self.credential, sub_id)
-
-                total_instances = 0
-                for vmss in compute_client.virtual_machine_scale_sets.list_all():
-                    instance_count = vmss.sku.capacity or 0
-                    total_instances += instance_count
-
-                    self.subscription_details["vmss"][sub_name].append({
-                        "name": vmss.name,
-                        "location": vmss.location,
-                        "instances": instance_count,
-                        "vm_size": vmss.sku.name,
-                    })
-
-                if total_instances > 0:
-                    self.results["vmss"][sub_name] = total_instances
-                    self._log(f"  {sub_name}: {total_instances} VMSS instances", "success")
-
-            except HttpResponseError as e:
-                if "NotFound" not in str(e):
-                    self._log(f"  {sub_name}: Error - {e.message}", "error")
-            except Exception as e:
-                self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        try:
+            resource_client = self._client(ResourceManagementClient, sub_id)
+
+            names, locations, instances, vm_sizes = [], [], [], []
+            # The generic resource envelope already carries the sku (size and capacity),
+            # without the scale set's full VM profile
+            scale_sets = resource_client.resources.list(
+                filter="resourceType eq 'Microsoft.Compute/virtualMachineScaleSets'"
+            )
+            for vmss in scale_sets:
+                names.append(vmss.name)
+                locations.append(vmss.location)
+                instances.append(vmss.sku.capacity or 0)
+                vm_sizes.append(vmss.sku.name)
+
+            total_instances = sum(instances)
+            details = {"name": names, "location": locations, "instances": instances, "vm_size": vm_sizes}
+
+            if total_instances > 0:
+                self._log(f"  {sub_name}: {total_instances} VMSS instances", "success")
+            return total_instances, details
+
+        except HttpResponseError as e:
+            if "NotFound" not in str(e):
+                self._log(f"  {sub_name}: Error - {e.message}", "error")
+        except Exception as e:
+            self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        return None
 
     def count_batch_pools(self):
         """Count Azure Batch pool nodes across all subscriptions."""
         self._log("Counting Batch pool nodes...", "info")
+        self._run_subscriptions("batch", self._count_batch_for_sub)
 
-        for subscription in self.subscriptions:
-            sub_id = subscription["id"]
-            sub_name = subscription["name"]
-
-            try:
-                batch_client = BatchManagementClient(self.credential, sub_id)
+    def _count_batch_for_sub(self, subscription):
+        """Count Azure Batch pool nodes in one subscription."""
+        sub_id = subscription["id"]
+        sub_name = subscription["name"]
 
-                total_nodes = 0
-                for account in batch_client.batch_account.list():
-                    try:
-                        resource_group = account.id.split("/")[4]  # Extract RG from resource ID
-
-                        for pool in batch_client.pool.list_by_batch_account(resource_group, account.name):
-                            # Get current dedicated and low-priority node counts
-                            dedicated = pool.current_dedicated_nodes or 0
-                            low_priority = pool.current_low_priority_nodes or 0
-                            pool_total = dedicated + low_priority
-                            total_nodes += pool_total
-
-                            if pool_total > 0:
-                                self.subscription_details["batch"][sub_name].append({
-                                    "account": account.name,
-                                    "pool": pool.name,
-                                    "dedicated_nodes": dedicated,
-                                    "low_priority_nodes": low_priority,
-                                })
-                    except Exception as e:
-                        self._log(f"  Error processing batch account {account.name}: {e}", "error")
+        try:
+            batch_client = self._client(BatchManagementClient, sub_id)
+
+            def list_pools(account):
+                try:
+                    resource_group = parse_resource_id(account.id)["resource_group"]
+                    return list(batch_client.pool.list_by_batch_account(resource_group, account.name))
+                except Exception as e:
+                    self._log(f"  Error processing batch account {account.name}: {e}", "error")
+                    return []
+
+            # Every account's pools are listed concurrently
+            accounts = list(batch_client.batch_account.list())
+            total_nodes = 0
+            account_names, pool_names, dedicated_nodes, low_priority_nodes = [], [], [], []
+            for account, pools in zip(accounts, self._account_executor.map(list_pools, accounts)):
+                for pool in pools:
+                    # Get current dedicated and low-priority node counts
+                    dedicated = pool.current_dedicated_nodes or 0
+                    low_priority = pool.current_low_priority_nodes or 0
+                    pool_total = dedicated + low_priority
+                    total_nodes += pool_total
+
+                    if pool_total > 0:
+                        account_names.append(account.name)
+                        pool_names.append(pool.name)
+                        dedicated_nodes.append(dedicated)
+                        low_priority_nodes.append(low_priority)
+
+            details = {
+                "account": account_names,
+                "pool": pool_names,
+                "dedicated_nodes": dedicated_nodes,
+                "low_priority_nodes": low_priority_nodes,
+            }
 
-                if total_nodes > 0:
-                    self.results["batch"][sub_name] = total_nodes
-                    self._log(f"  {sub_name}: {total_nodes} Batch nodes", "success")
+            if total_nodes > 0:
+                self._log(f"  {sub_name}: {total_nodes} Batch nodes", "success")
+            return total_nodes, details
 
-            except HttpResponseError as e:
-                if "NotFound" not in str(e):
-                    self._log(f"  {sub_name}: Error - {e.message}", "error")
-            except Exception as e:
-                self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        except HttpResponseError as e:
+            if "NotFound" not in str(e):
+                self._log(f"  {sub_name}: Error - {e.message}", "error")
+        except Exception as e:
+            self._log(f"  {sub_name}: Unexpected error - {e}", "error")
+        return None
 
-    def count_all(self):
-        """Count all compute resources."""
+    def print_header(self):
+        """Print scan banner to console."""
         print(f"\n{Fore.CYAN}{'='*80}{Style.RESET_ALL}")
         print(f"{Fore.CYAN}Starting Azure Compute Node Count{Style.RESET_ALL}")
         print(f"{Fore.CYAN}Scanning {len(self.subscriptions)} subscriptions...{Style.RESET_ALL}")
         print(f"{Fore.CYAN}{'='*80}{Style.RESET_ALL}\n")
 
-        self.count_virtual_machines()
-        self.count_aks_nodes()
-        self.count_container_instances()
-        self.count_azure_functions()
-        self.count_vmss_instances()
-        self.count_batch_pools()
+    def count_methods(self):
+        """Map each resource type to the method that counts it."""
+        return {
+            "vms": self.count_virtual_machines,
+            "aks": self.count_aks_nodes,
+            "aci": self.count_container_instances,
+            "functions": self.count_azure_functions,
+            "vmss": self.count_vmss_instances,
+            "batch": self.count_batch_pools,
+        }
+
+    def count_all(self, resources=None):
+        """
+        Count compute resources, running the resource types concurrently.
+
+        Args:
+            resources: Resource types to count (None for all); unknown types are ignored
+        """
+        count_methods = self.count_methods()
+        if resources:
+            count_methods = {r: count_methods[r] for r in resources if r in count_methods}
+        if not count_methods:
+            return
+
+        # One provider lookup per subscription pays off once it can skip several list calls
+        self._check_providers = len(count_methods) > 1
+
+        # Resource types get their own pool; their subscriptions fan out on self._executor
+        with ThreadPoolExecutor(max_workers=len(count_methods)) as executor:
+            for future in [executor.submit(method) for method in count_methods.values()]:
+                future.result()
 
     def get_summary(self):
         """Generate summary statistics."""
@@ -333,13 +985,16 @@ class AzureComputeCounter:
         }
 
         for resource_key, resource_name in resource_types.items():
-            if resource_key in self.results:
-                total = sum(self.results[resource_key].values())
-                subscriptions = self.results[resource_key]
+            subscriptions = self.results[resource_key]
+            if subscriptions:
+                total = sum(subscriptions.values())
+                cached = self.cached_results[resource_key]
 
-                # Format subscription details
-                sub_str = ", ".join([f"{s[:30]}... ({c})" if len(s) > 30 else f"{s} ({c})"
-                                    for s, c in sorted(subscriptions.items())])
+                # Format subscription details, flagging counts served from the cache
+                sub_str = ", ".join(
+                    f"{s[:30] + '...' if len(s) > 30 else s} ({c}{_cache_flag(cached.get(s))})"
+                    for s, c in sorted(subscriptions.items())
+                )
 
                 summary.append([resource_name, total, sub_str])
 
@@ -360,42 +1015,132 @@ class AzureComputeCounter:
         headers = ["Resource Type", "Count", "Subscriptions"]
         print(tabulate(summary, headers=headers, tablefmt="simple"))
 
+        cached = _found(self.cached_results)
+        if cached:
+            stale = any(entry["stale"] for subs in cached.values() for entry in subs.values())
+            print(f"{Fore.YELLOW}Counts marked 'cached' were reused from earlier runs (--cache-ttl)"
+                  f"{'; stale ones are expired results shown because the query failed' if stale else ''}."
+                  f"{Style.RESET_ALL}")
+
         total = sum(row[1] for row in summary)
         print(f"{Fore.GREEN}{'-'*80}{Style.RESET_ALL}")
         print(f"{Fore.GREEN}Total Compute Nodes: {total:,}{Style.RESET_ALL}")
         print(f"{Fore.GREEN}{'='*80}{Style.RESET_ALL}\n")
 
-    def export_json(self, output_file):
-        """Export results to JSON format."""
-        data = {
-            "timestamp": datetime.utcnow().isoformat(),
+    def to_dict(self):
+        """Return results as a JSON-serializable dict."""
+        results = _found(self.results)
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
             "provider": "azure",
             "summary": {
                 resource: sum(subs.values())
-                for resource, subs in self.results.items()
+                for resource, subs in results.items()
+            },
+            "details": results,
+            "cached_results": _found(self.cached_results),
+            # Transposed back to one dict per resource, as in earlier exports
+            "subscription_details": {
+                resource: {sub_name: _detail_rows(columns) for sub_name, columns in subs.items()}
+                for resource, subs in _found(self.subscription_details).items()
             },
-            "details": dict(self.results),
-            "subscription_details": dict(self.subscription_details),
         }
 
-        with open(output_file, "w") as f:
-            json.dump(data, f, indent=2)
+    def write_json(self, f):
+        """
+        Write results as JSON to a binary file object, in the same shape as to_dict.
+
+        Each subscription's details are transposed, serialized and written on their
+        own, so only one subscription's rows are held in memory at a time.
+        """
+        results = _found(self.results)
+        f.write(b"{\n")
+        _write_json_member(f, "timestamp", datetime.now(timezone.utc).isoformat())
+        _write_json_member(f, "provider", "azure")
+        _write_json_member(f, "summary", {resource: sum(subs.values()) for resource, subs in results.items()})
+        _write_json_member(f, "details", results)
+        _write_json_member(f, "cached_results", _found(self.cached_results))
+
+        f.write(b'  "subscription_details": {')
+        resources = list(_found(self.subscription_details).items())
+        if resources:
+            f.write(b"\n")
+            for i, (resource, subs) in enumerate(resources, start=1):
+                f.write(b"    " + _json_bytes(resource) + b": {\n")
+                sub_items = list(subs.items())
+                for j, (sub_name, columns) in enumerate(sub_items, start=1):
+                    _write_json_member(f, sub_name, _detail_rows(columns), depth=3, last=j == len(sub_items))
+                f.write(b"    }\n" if i == len(resources) else b"    },\n")
+            f.write(b"  ")
+        f.write(b"}\n}")
+
+    def export_json(self, output_file):
+        """Export results to JSON format."""
+        # write_json issues many small writes (one or more per subscription), so buffer generously
+        with open(output_file, "wb", buffering=1 << 20) as f:
+            self.write_json(f)
 
         print(f"{Fore.GREEN}Results exported to {output_file}{Style.RESET_ALL}")
 
+    def export_parquet(self, output_file):
+        """
+        Export per-resource details to Parquet, one file per resource type.
+
+        The column lists are written as-is, with a subscription column added. Files
+        are named after output_file with the resource type appended, e.g.
+        results-vms.parquet.
+        """
+        if pa is None:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+        base, ext = os.path.splitext(output_file)
+        for resource, subs in _found(self.subscription_details).items():
+            columns = {"subscription": []}
+            columns.update((column, []) for column in DETAIL_COLUMNS[resource])
+            for sub_name, sub_columns in subs.items():
+                columns["subscription"].extend([sub_name] * len(next(iter(sub_columns.values()))))
+                for column, values in sub_columns.items():
+                    columns[column].extend(values)
+
+            path = f"{base}-{resource}{ext or '.parquet'}"
+            pq.write_table(pa.table(columns), path)
+            print(f"{Fore.GREEN}Results exported to {path}{Style.RESET_ALL}")
+
     def export_csv(self, output_file):
         """Export results to CSV format."""
-        with open(output_file, "w", newline="") as f:
+        with open(output_file, "w", newline="", buffering=1 << 20) as f:
             writer = csv.writer(f)
             writer.writerow(["Resource Type", "Subscription", "Count"])
-
-            for resource, subscriptions in self.results.items():
-                for subscription, count in subscriptions.items():
-                    writer.writerow([resource, subscription, count])
+            writer.writerows(
+                (resource, subscription, count)
+                for resource, subscriptions in self.results.items()
+                for subscription, count in subscriptions.items()
+            )
 
         print(f"{Fore.GREEN}Results exported to {output_file}{Style.RESET_ALL}")
 
 
+def run(subscription_id=None, verbose=False, credential=None, use_cache=True):
+    """
+    Count all Azure compute resources and return the results.
+
+    Used by all_clouds.py to run the counter in-process.
+
+    Args:
+        subscription_id: Azure subscription ID (None for all subscriptions)
+        verbose: Enable verbose logging
+        credential: Optional shared Azure credential
+        use_cache: Reuse the cached subscription list (False re-lists subscriptions)
+
+    Returns:
+        Results dict in the same shape as the JSON export
+    """
+    with AzureComputeCounter(subscription_id=subscription_id, verbose=verbose, credential=credential,
+                             refresh_subscriptions=not use_cache) as counter:
+        counter.count_all()
+        return counter.to_dict()
+
+
 @click.command()
 @click.option(
     "--subscription-id",
@@ -410,8 +1155,8 @@ class AzureComputeCounter:
 @click.option(
     "--format",
     "output_format",
-    type=click.Choice(["json", "csv"], case_sensitive=False),
-    help="Output format (json or csv)",
+    type=click.Choice(["json", "csv", "parquet"], case_sensitive=False),
+    help="Output format (json, csv, or parquet for per-resource details; parquet needs pyarrow)",
     default="json",
 )
 @click.option(
@@ -424,7 +1169,36 @@ class AzureComputeCounter:
     help="Comma-separated list of resources to count (vms,aks,aci,functions,vmss,batch)",
     default="vms,aks,aci,functions,vmss,batch",
 )
-def main(subscription_id, output, output_format, verbose, resources):
+@click.option(
+    "--refresh-subs",
+    is_flag=True,
+    help="Re-list subscriptions instead of using the cached list (cached for 2 hours)",
+)
+@click.option(
+    "--cache-ttl",
+    type=click.IntRange(min=0),
+    help="Seconds to reuse cached per-subscription results (default: 0, no caching)",
+    default=0,
+)
+@click.option(
+    "--poll-interval",
+    type=click.IntRange(min=1),
+    help=f"Seconds between polls of long-running Azure operations (default: {DEFAULT_POLL_INTERVAL})",
+    default=DEFAULT_POLL_INTERVAL,
+)
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    help=f"Threads used to query subscriptions concurrently (default: {MAX_WORKERS})",
+    default=MAX_WORKERS,
+)
+@click.option(
+    "--arm-batch",
+    is_flag=True,
+    help="List VMs, AKS clusters and scale sets for up to 20 subscriptions per request via ARM $batch",
+)
+def main(subscription_id, output, output_format, verbose, resources, refresh_subs, cache_ttl, poll_interval,
+         max_workers, arm_batch):
     """
     Count all compute nodes across Azure services.
 
@@ -436,35 +1210,34 @@ def main(subscription_id, output, output_format, verbose, resources):
         resource_list = [r.strip() for r in resources.split(",")]
 
         # Initialize counter
-        counter = AzureComputeCounter(subscription_id=subscription_id, verbose=verbose)
-
-        # Count resources based on filter
-        if "vms" in resource_list:
-            counter.count_virtual_machines()
-        if "aks" in resource_list:
-            counter.count_aks_nodes()
-        if "aci" in resource_list:
-            counter.count_container_instances()
-        if "functions" in resource_list:
-            counter.count_azure_functions()
-        if "vmss" in resource_list:
-            counter.count_vmss_instances()
-        if "batch" in resource_list:
-            counter.count_batch_pools()
-
-        # If no filters, count all
-        if resources == "vms,aks,aci,functions,vmss,batch":
-            counter.count_all()
-
-        # Print summary
-        counter.print_summary()
-
-        # Export if requested
-        if output:
-            if output_format == "json":
-                counter.export_json(output)
-            elif output_format == "csv":
-                counter.export_csv(output)
+        with AzureComputeCounter(
+            subscription_id=subscription_id,
+            verbose=verbose,
+            refresh_subscriptions=refresh_subs,
+            cache_ttl=cache_ttl,
+            arm_batch=arm_batch,
+            poll_interval=poll_interval,
+            max_workers=max_workers,
+        ) as counter:
+            counter.print_header()
+
+            # Count the selected resources (each exactly once)
+            unknown = [r for r in resource_list if r not in counter.count_methods()]
+            if unknown:
+                print(f"{Fore.YELLOW}Ignoring unknown resource type(s): {', '.join(unknown)}{Style.RESET_ALL}")
+            counter.count_all(resources=resource_list)
+
+            # Print summary
+            counter.print_summary()
+
+            # Export if requested
+            if output:
+                if output_format == "json":
+                    counter.export_json(output)
+                elif output_format == "csv":
+                    counter.export_csv(output)
+                elif output_format == "parquet":
+                    counter.export_parquet(output)
 
     except ClientAuthenticationError:
         print(f"\n{Fore.RED}Error: Azure authentication failed.{Style.RESET_ALL}")
@@ -479,7 +1252,6 @@ def main(subscription_id, output, output_format, verbose, resources):
     except Exception as e:
         print(f"\n{Fore.RED}Error: {e}{Style.RESET_ALL}")
         if verbose:
-            import traceback
             traceback.print_exc()
         sys.exit(1)
 
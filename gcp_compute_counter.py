@@ -6,55 +6,185 @@ Counts all compute resources across GCP including Compute Engine VMs, GKE nodes,
 Cloud Run services, Cloud Functions, App Engine instances, and Dataflow workers.
 """
 
+import hashlib
 import json
 import csv
+import os
 import sys
+import threading
+import time
+import traceback
 from collections import defaultdict
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
 import click
+import requests
 from google.cloud import compute_v1
 from google.cloud import container_v1
 from google.cloud import run_v2
 from google.cloud import functions_v1
 from google.cloud import appengine_v1
 from google.cloud import resourcemanager_v3
+from google.cloud import service_usage_v1
 from google.auth import default as google_auth_default
 from google.auth.exceptions import DefaultCredentialsError
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.api_core.exceptions import GoogleAPIError, PermissionDenied
+from google.api_core.retry import Retry, if_transient_error
 from tabulate import tabulate
 from colorama import init, Fore, Style
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
 # Initialize colorama
 init(autoreset=True)
 
+# Raised when no application default credentials are found (also used by all_clouds.py)
+CREDENTIALS_NOT_FOUND = "GCP credentials not found. Please run 'gcloud auth login'"
+
+# Upper bound on project calls in flight at once, to stay clear of per-project API quotas
+MAX_CONCURRENCY = 16
+
+# Project lists and enabled APIs rarely change, so they are reused from disk between runs
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "csp-scripts", "gcp")
+PROJECT_CACHE_TTL = 24 * 60 * 60
+# Looks up the account behind user (gcloud) access tokens, which do not name it
+TOKENINFO_URL = "https://oauth2.googleapis.com/tokeninfo"
+# Kept short: an API enabled after the list was cached is skipped until the entry expires
+API_CACHE_TTL = 60 * 60
+
+# API each resource type needs enabled in a project
+RESOURCE_APIS = {
+    "gce": "compute.googleapis.com",
+    "gke": "container.googleapis.com",
+    "cloud_run": "run.googleapis.com",
+    "cloud_functions": "cloudfunctions.googleapis.com",
+    "app_engine": "appengine.googleapis.com",
+}
+
+# Largest page each list API accepts, so big projects take as few round trips as possible
+PAGE_SIZES = {
+    "gce": 500,
+    "cloud_run": 1000,
+    "cloud_functions": 500,
+    "app_engine": 500,
+}
+
+# Response field masks for the instance listing: only the fields that are read come
+# back over the wire (nextPageToken must stay in, or paging stops after one page)
+GCE_FIELDS = "nextPageToken,items/*/instances(name,machineType,status)"
+GCE_COUNT_FIELDS = "nextPageToken,items/*/instances(name)"
+
+# Transient failures (429, 500, 503) are retried with exponential backoff
+RETRY = Retry(predicate=if_transient_error, initial=1.0, maximum=30.0, multiplier=2.0)
+
+
+def _json_bytes(data):
+    """Serialize data to indented JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+
+def credentials_principal(credentials):
+    """
+    Get the account the credentials act as, or None if it cannot be determined.
+
+    Service account credentials name their account. User credentials from gcloud
+    do not, so their access token is looked up with the tokeninfo endpoint.
+    """
+    try:
+        if not credentials.valid:
+            # Compute Engine credentials only learn their account on refresh
+            credentials.refresh(GoogleAuthRequest())
+        email = getattr(credentials, "service_account_email", None)
+        if email and email != "default":
+            return email
+
+        response = requests.get(TOKENINFO_URL, params={"access_token": credentials.token}, timeout=10)
+        response.raise_for_status()
+        info = response.json()
+        return info.get("email") or info["sub"]
+    except Exception:
+        return None
+
 
 class GCPComputeCounter:
     """Count compute resources across GCP services."""
 
-    def __init__(self, project_id=None, verbose=False):
+    def __init__(self, project_id=None, verbose=False, credentials=None, max_concurrency=MAX_CONCURRENCY,
+                 collect_details=True, gce_filter=None, use_cache=True):
         """
         Initialize GCP compute counter.
 
         Args:
             project_id: GCP project ID (None for default project)
             verbose: Enable verbose logging
+            credentials: Optional pre-built google.auth credentials (skips credential discovery)
+            max_concurrency: Project calls in flight at once, across all resource types
+            collect_details: Record per-resource details in project_details (False counts only)
+            gce_filter: Optional Compute Engine list filter applied server-side, e.g. 'status = RUNNING'
+            use_cache: Reuse project lists and enabled APIs cached on disk (False re-lists them)
         """
         self.verbose = verbose
+        self.collect_details = collect_details
+        self.gce_filter = gce_filter
+        self.use_cache = use_cache
+        self._cache_key = None
         self.project_id = project_id
         self.projects = []
         self.results = defaultdict(lambda: defaultdict(int))
         self.project_details = defaultdict(lambda: defaultdict(list))
+        # Running per-resource totals, updated as project results are merged
+        self._totals = defaultdict(int)
+        # One pool bounds in-flight project calls across all resource types;
+        # the lock guards results and details while those types run concurrently
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._lock = threading.Lock()
+        # API clients are created once per class and shared by all projects and threads
+        self._clients = {}
+        # Enabled APIs per project, looked up once each when several resource
+        # types are counted (see count_all)
+        self._check_apis = False
+        self._enabled_apis = {}
+        self._api_locks = {}
+        # Projects whose enabled APIs came from the cache, and resource -> projects
+        # skipped on that cached data, so the summary can say so
+        self._cached_api_projects = set()
+        self.skipped_by_cached_apis = defaultdict(list)
 
         # Initialize credentials
         try:
-            self.credentials, default_project = google_auth_default()
-            if not self.project_id:
-                self.project_id = default_project
+            if credentials is not None:
+                self.credentials = credentials
+            else:
+                self.credentials, default_project = google_auth_default()
+                if not self.project_id:
+                    self.project_id = default_project
 
             self._get_projects()
+            # Sorted once here so results are recorded, and summaries listed, in name order
+            self.projects.sort(key=lambda project: project["name"])
         except DefaultCredentialsError as e:
-            raise Exception("GCP credentials not found. Please run 'gcloud auth login'") from e
+            self.close()
+            raise Exception(CREDENTIALS_NOT_FOUND) from e
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Shut down the project worker pool."""
+        self._executor.shutdown(wait=False)
 
     def _log(self, message, level="info"):
         """Log message if verbose mode is enabled."""
@@ -67,6 +197,62 @@ class GCPComputeCounter:
             }
             print(f"{colors.get(level, '')}{message}{Style.RESET_ALL}")
 
+    def _client(self, client_class):
+        """Get the cached API client of a class, creating it on first use."""
+        client = self._clients.get(client_class)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(client_class)
+                if client is None:
+                    client = self._clients[client_class] = client_class(credentials=self.credentials)
+        return client
+
+    def _cache_path(self, name):
+        """
+        Get a cache file path, keyed by the principal the credentials belong to.
+
+        Returns None if the principal is unknown, so nothing is cached rather
+        than sharing entries between accounts.
+        """
+        if self._cache_key is None:
+            principal = credentials_principal(self.credentials)
+            if principal is None:
+                self._log("Could not determine the GCP account, not caching", "warning")
+            self._cache_key = hashlib.sha256(str(principal).encode("utf-8")).hexdigest()[:12] if principal else ""
+        if not self._cache_key:
+            return None
+        return os.path.join(CACHE_DIR, self._cache_key, f"{name}.json")
+
+    def _load_cache(self, name, ttl):
+        """Load a cached value, or None if caching is off or the entry is missing, unreadable or expired."""
+        if not self.use_cache:
+            return None
+        path = self._cache_path(name)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                entry = json.loads(f.read())
+            if time.time() - entry["ts"] < ttl:
+                return entry["data"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _save_cache(self, name, data):
+        """Atomically write a value to the cache."""
+        path = self._cache_path(name)
+        if path is None:
+            return
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w") as f:
+                json.dump({"ts": time.time(), "data": data}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            self._log(f"Could not write cache {path}: {e}", "warning")
+
     def _get_projects(self):
         """Get list of GCP projects."""
         if self.project_id:
@@ -74,20 +260,25 @@ class GCPComputeCounter:
             self.projects = [{"id": self.project_id, "name": self.project_id}]
             self._log(f"Using project: {self.project_id}", "info")
         else:
+            cached_projects = self._load_cache("projects", PROJECT_CACHE_TTL)
+            if cached_projects is not None:
+                self.projects = cached_projects
+                self._log(f"Using {len(self.projects)} cached projects (--no-cache to re-list)", "info")
+                return
+
             # Try to get all projects (requires resourcemanager.projects.list permission)
             try:
                 client = resourcemanager_v3.ProjectsClient(credentials=self.credentials)
-                request = resourcemanager_v3.SearchProjectsRequest()
+                # Only active projects are returned, so deleted ones are never transferred
+                request = resourcemanager_v3.SearchProjectsRequest(query="state:ACTIVE")
 
-                self.projects = []
-                for project in client.search_projects(request=request):
-                    if project.state == resourcemanager_v3.Project.State.ACTIVE:
-                        self.projects.append({
-                            "id": project.project_id,
-                            "name": project.display_name or project.project_id,
-                        })
+                self.projects = [
+                    {"id": project.project_id, "name": project.display_name or project.project_id}
+                    for project in client.search_projects(request=request, retry=RETRY)
+                ]
 
                 self._log(f"Found {len(self.projects)} active projects", "success")
+                self._save_cache("projects", self.projects)
             except Exception as e:
                 self._log(f"Could not list all projects: {e}", "warning")
                 if self.project_id:
@@ -95,217 +286,397 @@ class GCPComputeCounter:
                 else:
                     raise Exception("No project specified and unable to list projects")
 
+    def _get_enabled_apis(self, project):
+        """
+        Get the APIs (of those in RESOURCE_APIS) enabled in a project, with one batch call.
+
+        Looked up once per project even when resource types run concurrently, and
+        cached on disk for API_CACHE_TTL. Returns None if the lookup fails, meaning
+        nothing is skipped.
+        """
+        project_id = project["id"]
+        with self._lock:
+            lock = self._api_locks.setdefault(project_id, threading.Lock())
+
+        with lock:
+            if project_id not in self._enabled_apis:
+                cached_apis = self._load_cache(f"apis-{project_id}", API_CACHE_TTL)
+                if cached_apis is not None:
+                    self._enabled_apis[project_id] = set(cached_apis)
+                    self._cached_api_projects.add(project_id)
+                    return self._enabled_apis[project_id]
+
+                try:
+                    client = self._client(service_usage_v1.ServiceUsageClient)
+                    request = service_usage_v1.BatchGetServicesRequest(
+                        parent=f"projects/{project_id}",
+                        names=[f"projects/{project_id}/services/{api}" for api in set(RESOURCE_APIS.values())],
+                    )
+                    response = client.batch_get_services(request=request, retry=RETRY)
+                    self._enabled_apis[project_id] = {
+                        service.name.rpartition("/")[2]
+                        for service in response.services
+                        if service.state == service_usage_v1.State.ENABLED
+                    }
+                    self._save_cache(f"apis-{project_id}", sorted(self._enabled_apis[project_id]))
+                except Exception as e:
+                    self._log(f"  {project['name']}: Could not check enabled APIs - {e}", "warning")
+                    self._enabled_apis[project_id] = None
+            return self._enabled_apis[project_id]
+
+    def _enabled(self, resource, count_project):
+        """
+        Wrap a per-project count function to skip projects where the resource
+        type's API is disabled, which cannot contain any.
+        """
+        if not self._check_apis or resource not in RESOURCE_APIS:
+            return count_project
+
+        api = RESOURCE_APIS[resource]
+
+        def enabled_count_project(project):
+            enabled_apis = self._get_enabled_apis(project)
+            if enabled_apis is not None and api not in enabled_apis:
+                if project["id"] in self._cached_api_projects:
+                    self._log(f"  {project['name']}: Skipping {resource}, {api} was disabled when last checked "
+                              f"(--no-cache to re-check)", "warning")
+                    with self._lock:
+                        self.skipped_by_cached_apis[resource].append(project["name"])
+                return 0, []
+            return count_project(project)
+
+        return enabled_count_project
+
+    def _run_projects(self, resource, count_project):
+        """
+        Count one resource type in every project concurrently and merge the results.
+
+        Results are merged in project order, under the lock since several
+        resource types may be counted at once.
+
+        Args:
+            resource: Results key for the resource type
+            count_project: Callable taking a project dict and returning
+                (count, details), or None if the project could not be counted
+        """
+        count_project = self._enabled(resource, count_project)
+
+        results = self._executor.map(count_project, self.projects)
+        for project, result in zip(self.projects, results):
+            self._merge(resource, project, result)
+
+    def _merge(self, resource, project, result):
+        """Merge one project's (count, details) result for a resource type, skipping None."""
+        if result is None:
+            return
+
+        count, details = result
+        project_name = project["name"]
+        with self._lock:
+            if details:
+                self.project_details[resource][project_name].extend(details)
+            if count > 0:
+                self._totals[resource] += count - self.results[resource].get(project_name, 0)
+                self.results[resource][project_name] = count
+
     def count_compute_engine_vms(self):
         """Count Compute Engine VM instances across all projects."""
         self._log("Counting Compute Engine VMs...", "info")
+        self._run_projects("gce", self._count_gce_for_project)
 
-        for project in self.projects:
-            project_id = project["id"]
-            project_name = project["name"]
+    def _count_gce_for_project(self, project):
+        """Count Compute Engine VM instances in one project."""
+        project_id = project["id"]
+        project_name = project["name"]
 
-            try:
-                client = compute_v1.InstancesClient(credentials=self.credentials)
-
-                count = 0
-                # List instances across all zones
-                aggregated_list = client.aggregated_list(project=project_id)
-
-                for zone, response in aggregated_list:
-                    if response.instances:
-                        for instance in response.instances:
-                            count += 1
-                            zone_name = zone.split("/")[-1]
-
-                            self.project_details["gce"][project_name].append({
-                                "name": instance.name,
-                                "zone": zone_name,
-                                "machine_type": instance.machine_type.split("/")[-1],
-                                "status": instance.status,
-                            })
-
-                if count > 0:
-                    self.results["gce"][project_name] = count
-                    self._log(f"  {project_name}: {count} Compute Engine VMs", "success")
-
-            except PermissionDenied:
-                self._log(f"  {project_name}: Permission denied", "error")
-            except GoogleAPIError as e:
-                self._log(f"  {project_name}: API error - {e.message}", "error")
-            except Exception as e:
-                self._log(f"  {project_name}: Unexpected error - {e}", "error")
+        try:
+            client = self._client(compute_v1.InstancesClient)
+
+            count = 0
+            details = []
+            # List instances across all zones; pages are fetched as the loop reaches them
+            request = compute_v1.AggregatedListInstancesRequest(project=project_id, max_results=PAGE_SIZES["gce"])
+            if self.gce_filter:
+                request.filter = self.gce_filter
+            fields = GCE_FIELDS if self.collect_details else GCE_COUNT_FIELDS
+            aggregated_list = client.aggregated_list(
+                request=request, retry=RETRY, metadata=[("x-goog-fieldmask", fields)]
+            )
+
+            for zone, response in aggregated_list:
+                if response.instances:
+                    count += len(response.instances)
+                    if not self.collect_details:
+                        continue
+
+                    zone_name = zone.rpartition("/")[2]
+                    details.extend({
+                        "name": instance.name,
+                        "zone": zone_name,
+                        "machine_type": instance.machine_type.rpartition("/")[2],
+                        "status": instance.status,
+                    } for instance in response.instances)
+
+            if count > 0:
+                self._log(f"  {project_name}: {count} Compute Engine VMs", "success")
+            return count, details
+
+        except PermissionDenied:
+            self._log(f"  {project_name}: Permission denied", "error")
+        except GoogleAPIError as e:
+            self._log(f"  {project_name}: API error - {e.message}", "error")
+        except Exception as e:
+            self._log(f"  {project_name}: Unexpected error - {e}", "error")
+        return None
 
     def count_gke_nodes(self):
         """Count GKE cluster nodes across all projects."""
         self._log("Counting GKE nodes...", "info")
+        self._run_projects("gke", self._count_gke_for_project)
 
-        for project in self.projects:
-            project_id = project["id"]
-            project_name = project["name"]
+    def _count_gke_for_project(self, project):
+        """Count GKE cluster nodes in one project."""
+        project_id = project["id"]
+        project_name = project["name"]
 
-            try:
-                client = container_v1.ClusterManagerClient(credentials=self.credentials)
+        try:
+            client = self._client(container_v1.ClusterManagerClient)
 
-                total_nodes = 0
-                # List clusters across all locations (zones and regions)
-                parent = f"projects/{project_id}/locations/-"
+            total_nodes = 0
+            details = []
+            # List clusters across all locations (zones and regions)
+            parent = f"projects/{project_id}/locations/-"
 
-                try:
-                    response = client.list_clusters(parent=parent)
+            try:
+                response = client.list_clusters(parent=parent, retry=RETRY)
 
-                    for cluster in response.clusters:
-                        # Count nodes from node pools
-                        for node_pool in cluster.node_pools:
-                            node_count = node_pool.initial_node_count or 0
-                            # Use current size if available
-                            if hasattr(node_pool, 'status') and node_pool.status:
-                                node_count = getattr(node_pool, 'current_node_count', node_count)
+                for cluster in response.clusters:
+                    # Count nodes from node pools
+                    for node_pool in cluster.node_pools:
+                        node_count = node_pool.initial_node_count or 0
+                        # Use current size if available
+                        if hasattr(node_pool, 'status') and node_pool.status:
+                            node_count = getattr(node_pool, 'current_node_count', node_count)
 
-                            total_nodes += node_count
+                        total_nodes += node_count
 
-                            self.project_details["gke"][project_name].append({
+                        if self.collect_details:
+                            details.append({
                                 "cluster": cluster.name,
                                 "location": cluster.location,
                                 "node_pool": node_pool.name,
                                 "nodes": node_count,
                             })
-                except GoogleAPIError:
-                    pass  # GKE API might not be enabled
+            except GoogleAPIError:
+                pass  # GKE API might not be enabled
 
-                if total_nodes > 0:
-                    self.results["gke"][project_name] = total_nodes
-                    self._log(f"  {project_name}: {total_nodes} GKE nodes", "success")
+            if total_nodes > 0:
+                self._log(f"  {project_name}: {total_nodes} GKE nodes", "success")
+            return total_nodes, details
 
-            except PermissionDenied:
-                self._log(f"  {project_name}: Permission denied", "error")
-            except Exception as e:
-                self._log(f"  {project_name}: Unexpected error - {e}", "error")
+        except PermissionDenied:
+            self._log(f"  {project_name}: Permission denied", "error")
+        except Exception as e:
+            self._log(f"  {project_name}: Unexpected error - {e}", "error")
+        return None
 
     def count_cloud_run_services(self):
         """Count Cloud Run service instances across all projects."""
         self._log("Counting Cloud Run services...", "info")
+        self._run_projects("cloud_run", self._count_cloud_run_for_project)
 
-        for project in self.projects:
-            project_id = project["id"]
-            project_name = project["name"]
+    def _count_cloud_run_for_project(self, project):
+        """Count Cloud Run services in one project."""
+        project_id = project["id"]
+        project_name = project["name"]
 
-            try:
-                client = run_v2.ServicesClient(credentials=self.credentials)
+        try:
+            client = self._client(run_v2.ServicesClient)
 
-                count = 0
-                # List services across all locations
-                parent = f"projects/{project_id}/locations/-"
+            count = 0
+            details = []
+            # List services across all locations
+            parent = f"projects/{project_id}/locations/-"
 
-                try:
-                    for service in client.list_services(parent=parent):
-                        # Each service counts as a compute resource
-                        count += 1
-
-                        # Get max instances if configured
-                        max_instances = 1
-                        if service.template and service.template.scaling:
-                            max_instances = service.template.scaling.max_instance_count or 1
-
-                        self.project_details["cloud_run"][project_name].append({
-                            "name": service.name.split("/")[-1],
-                            "location": service.name.split("/")[3],
-                            "max_instances": max_instances,
-                        })
-                except GoogleAPIError:
-                    pass  # Cloud Run API might not be enabled
-
-                if count > 0:
-                    self.results["cloud_run"][project_name] = count
-                    self._log(f"  {project_name}: {count} Cloud Run services", "success")
-
-            except PermissionDenied:
-                self._log(f"  {project_name}: Permission denied", "error")
-            except Exception as e:
-                self._log(f"  {project_name}: Unexpected error - {e}", "error")
+            try:
+                request = run_v2.ListServicesRequest(parent=parent, page_size=PAGE_SIZES["cloud_run"])
+                for service in client.list_services(request=request, retry=RETRY):
+                    # Each service counts as a compute resource
+                    count += 1
+                    if not self.collect_details:
+                        continue
+
+                    # Get max instances if configured
+                    max_instances = 1
+                    if service.template and service.template.scaling:
+                        max_instances = service.template.scaling.max_instance_count or 1
+
+                    # projects/{project}/locations/{location}/services/{service}
+                    parts = service.name.split("/", 5)
+                    details.append({
+                        "name": parts[5],
+                        "location": parts[3],
+                        "max_instances": max_instances,
+                    })
+            except GoogleAPIError:
+                pass  # Cloud Run API might not be enabled
+
+            if count > 0:
+                self._log(f"  {project_name}: {count} Cloud Run services", "success")
+            return count, details
+
+        except PermissionDenied:
+            self._log(f"  {project_name}: Permission denied", "error")
+        except Exception as e:
+            self._log(f"  {project_name}: Unexpected error - {e}", "error")
+        return None
 
     def count_cloud_functions(self):
         """Count Cloud Functions across all projects."""
         self._log("Counting Cloud Functions...", "info")
+        self._run_projects("cloud_functions", self._count_cloud_functions_for_project)
 
-        for project in self.projects:
-            project_id = project["id"]
-            project_name = project["name"]
+    def _count_cloud_functions_for_project(self, project):
+        """Count Cloud Functions in one project."""
+        project_id = project["id"]
+        project_name = project["name"]
 
-            try:
-                client = functions_v1.CloudFunctionsServiceClient(credentials=self.credentials)
+        try:
+            client = self._client(functions_v1.CloudFunctionsServiceClient)
 
-                count = 0
-                # List functions across all locations
-                parent = f"projects/{project_id}/locations/-"
+            count = 0
+            details = []
+            # List functions across all locations
+            parent = f"projects/{project_id}/locations/-"
 
-                try:
-                    for function in client.list_functions(parent=parent):
-                        count += 1
-
-                        self.project_details["cloud_functions"][project_name].append({
-                            "name": function.name.split("/")[-1],
-                            "location": function.name.split("/")[3],
-                            "runtime": function.runtime,
-                            "status": function.status.name if hasattr(function, 'status') else "ACTIVE",
-                        })
-                except GoogleAPIError:
-                    pass  # Cloud Functions API might not be enabled
-
-                if count > 0:
-                    self.results["cloud_functions"][project_name] = count
-                    self._log(f"  {project_name}: {count} Cloud Functions", "success")
-
-            except PermissionDenied:
-                self._log(f"  {project_name}: Permission denied", "error")
-            except Exception as e:
-                self._log(f"  {project_name}: Unexpected error - {e}", "error")
+            try:
+                request = functions_v1.ListFunctionsRequest(parent=parent, page_size=PAGE_SIZES["cloud_functions"])
+                for function in client.list_functions(request=request, retry=RETRY):
+                    count += 1
+                    if not self.collect_details:
+                        continue
+
+                    # projects/{project}/locations/{location}/functions/{function}
+                    parts = function.name.split("/", 5)
+                    details.append({
+                        "name": parts[5],
+                        "location": parts[3],
+                        "runtime": function.runtime,
+                        "status": function.status.name if hasattr(function, 'status') else "ACTIVE",
+                    })
+            except GoogleAPIError:
+                pass  # Cloud Functions API might not be enabled
+
+            if count > 0:
+                self._log(f"  {project_name}: {count} Cloud Functions", "success")
+            return count, details
+
+        except PermissionDenied:
+            self._log(f"  {project_name}: Permission denied", "error")
+        except Exception as e:
+            self._log(f"  {project_name}: Unexpected error - {e}", "error")
+        return None
 
     def count_app_engine_instances(self):
         """Count App Engine instances across all projects."""
         self._log("Counting App Engine instances...", "info")
+        self._run_projects("app_engine", self._count_app_engine_for_project)
 
-        for project in self.projects:
-            project_id = project["id"]
-            project_name = project["name"]
-
-            try:
-                client = appengine_v1.InstancesClient(credentials=self.credentials)
+    def _count_app_engine_for_project(self, project):
+        """Count App Engine instances in one project."""
+        project_id = project["id"]
+        project_name = project["name"]
 
-                count = 0
-                parent = f"apps/{project_id}/services/-/versions/-"
+        try:
+            client = self._client(appengine_v1.InstancesClient)
 
-                try:
-                    for instance in client.list_instances(parent=parent):
-                        count += 1
-
-                        self.project_details["app_engine"][project_name].append({
-                            "id": instance.name.split("/")[-1],
-                            "service": instance.name.split("/")[3],
-                            "version": instance.name.split("/")[5],
-                        })
-                except GoogleAPIError:
-                    pass  # App Engine might not be enabled or have no instances
-
-                if count > 0:
-                    self.results["app_engine"][project_name] = count
-                    self._log(f"  {project_name}: {count} App Engine instances", "success")
-
-            except PermissionDenied:
-                self._log(f"  {project_name}: Permission denied", "error")
-            except Exception as e:
-                self._log(f"  {project_name}: Unexpected error - {e}", "error")
+            count = 0
+            details = []
+            parent = f"apps/{project_id}/services/-/versions/-"
 
-    def count_all(self):
-        """Count all compute resources."""
+            try:
+                request = appengine_v1.ListInstancesRequest(parent=parent, page_size=PAGE_SIZES["app_engine"])
+                for instance in client.list_instances(request=request, retry=RETRY):
+                    count += 1
+                    if not self.collect_details:
+                        continue
+
+                    # apps/{app}/services/{service}/versions/{version}/instances/{instance}
+                    parts = instance.name.split("/")
+                    details.append({
+                        "id": parts[-1],
+                        "service": parts[3],
+                        "version": parts[5],
+                    })
+            except GoogleAPIError:
+                pass  # App Engine might not be enabled or have no instances
+
+            if count > 0:
+                self._log(f"  {project_name}: {count} App Engine instances", "success")
+            return count, details
+
+        except PermissionDenied:
+            self._log(f"  {project_name}: Permission denied", "error")
+        except Exception as e:
+            self._log(f"  {project_name}: Unexpected error - {e}", "error")
+        return None
+
+    def print_header(self):
+        """Print scan banner to console."""
         print(f"\n{Fore.CYAN}{'='*80}{Style.RESET_ALL}")
         print(f"{Fore.CYAN}Starting GCP Compute Node Count{Style.RESET_ALL}")
         print(f"{Fore.CYAN}Scanning {len(self.projects)} project(s)...{Style.RESET_ALL}")
         print(f"{Fore.CYAN}{'='*80}{Style.RESET_ALL}\n")
 
-        self.count_compute_engine_vms()
-        self.count_gke_nodes()
-        self.count_cloud_run_services()
-        self.count_cloud_functions()
-        self.count_app_engine_instances()
+    def count_methods(self):
+        """Map each resource type to the method that counts it."""
+        return {
+            "gce": self.count_compute_engine_vms,
+            "gke": self.count_gke_nodes,
+            "cloud_run": self.count_cloud_run_services,
+            "cloud_functions": self.count_cloud_functions,
+            "app_engine": self.count_app_engine_instances,
+        }
+
+    def _project_count_methods(self):
+        """Map each resource type to the method that counts it in one project."""
+        return {
+            "gce": self._count_gce_for_project,
+            "gke": self._count_gke_for_project,
+            "cloud_run": self._count_cloud_run_for_project,
+            "cloud_functions": self._count_cloud_functions_for_project,
+            "app_engine": self._count_app_engine_for_project,
+        }
+
+    def count_all(self, resources=None):
+        """
+        Count compute resources in one pass over the projects.
+
+        Every (project, resource type) call is queued on the shared pool, grouped
+        by project so each project's calls run together and reuse its enabled-API
+        lookup. Results are merged in project order as they complete.
+
+        Args:
+            resources: Resource types to count (None for all); unknown types are ignored
+        """
+        count_methods = self._project_count_methods()
+        if resources:
+            count_methods = {r: count_methods[r] for r in resources if r in count_methods}
+        if not count_methods:
+            return
+
+        # One API check per project pays off once it can skip several list calls
+        self._check_apis = len(count_methods) > 1
+
+        self._log(f"Counting {', '.join(count_methods)} in {len(self.projects)} project(s)...", "info")
+        calls = [
+            (resource, project, self._enabled(resource, count_project))
+            for project in self.projects
+            for resource, count_project in count_methods.items()
+        ]
+        futures = [self._executor.submit(count_project, project) for _, project, count_project in calls]
+        for (resource, project, _), future in zip(calls, futures):
+            self._merge(resource, project, future.result())
 
     def get_summary(self):
         """Generate summary statistics."""
@@ -319,13 +690,14 @@ class GCPComputeCounter:
         }
 
         for resource_key, resource_name in resource_types.items():
-            if resource_key in self.results:
-                total = sum(self.results[resource_key].values())
+            if resource_key in self._totals:
+                total = self._totals[resource_key]
                 projects = self.results[resource_key]
 
-                # Format project details
-                proj_str = ", ".join([f"{p[:30]}... ({c})" if len(p) > 30 else f"{p} ({c})"
-                                     for p, c in sorted(projects.items())])
+                # Format project details (recorded in self.projects order, already sorted)
+                proj_str = ", ".join(
+                    f"{p[:30]}... ({c})" if len(p) > 30 else f"{p} ({c})" for p, c in projects.items()
+                )
 
                 summary.append([resource_name, total, proj_str])
 
@@ -337,6 +709,7 @@ class GCPComputeCounter:
 
         if not summary:
             print(f"\n{Fore.YELLOW}No compute resources found.{Style.RESET_ALL}")
+            self._print_skipped()
             return
 
         print(f"\n{Fore.GREEN}{'='*80}{Style.RESET_ALL}")
@@ -345,43 +718,76 @@ class GCPComputeCounter:
 
         headers = ["Resource Type", "Count", "Projects"]
         print(tabulate(summary, headers=headers, tablefmt="simple"))
+        self._print_skipped()
 
         total = sum(row[1] for row in summary)
         print(f"{Fore.GREEN}{'-'*80}{Style.RESET_ALL}")
         print(f"{Fore.GREEN}Total Compute Nodes: {total:,}{Style.RESET_ALL}")
         print(f"{Fore.GREEN}{'='*80}{Style.RESET_ALL}\n")
 
-    def export_json(self, output_file):
-        """Export results to JSON format."""
-        data = {
-            "timestamp": datetime.utcnow().isoformat(),
+    def _print_skipped(self):
+        """Note resource types skipped on enabled-API data from the cache, which may be out of date."""
+        if self.skipped_by_cached_apis:
+            skipped = ", ".join(f"{resource} ({len(projects)} projects)"
+                                for resource, projects in sorted(self.skipped_by_cached_apis.items()))
+            print(f"{Fore.YELLOW}Skipped because their API was disabled when last checked: {skipped}"
+                  f" (--no-cache to re-check).{Style.RESET_ALL}")
+
+    def to_dict(self):
+        """Return results as a JSON-serializable dict."""
+        return {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
             "provider": "gcp",
-            "summary": {
-                resource: sum(projects.values())
-                for resource, projects in self.results.items()
-            },
+            "summary": dict(self._totals),
             "details": dict(self.results),
             "project_details": dict(self.project_details),
+            "skipped_by_cached_apis": dict(self.skipped_by_cached_apis),
         }
 
-        with open(output_file, "w") as f:
-            json.dump(data, f, indent=2)
+    def export_json(self, output_file):
+        """Export results to JSON format."""
+        data = self.to_dict()
+
+        with open(output_file, "wb") as f:
+            f.write(_json_bytes(data))
 
         print(f"{Fore.GREEN}Results exported to {output_file}{Style.RESET_ALL}")
 
     def export_csv(self, output_file):
         """Export results to CSV format."""
-        with open(output_file, "w", newline="") as f:
+        with open(output_file, "w", newline="", buffering=1 << 20) as f:
             writer = csv.writer(f)
             writer.writerow(["Resource Type", "Project", "Count"])
-
-            for resource, projects in self.results.items():
-                for project, count in projects.items():
-                    writer.writerow([resource, project, count])
+            writer.writerows(
+                (resource, project, count)
+                for resource, projects in self.results.items()
+                for project, count in projects.items()
+            )
 
         print(f"{Fore.GREEN}Results exported to {output_file}{Style.RESET_ALL}")
 
 
+def run(project_id=None, verbose=False, credentials=None, use_cache=True):
+    """
+    Count all GCP compute resources and return the results.
+
+    Used by all_clouds.py to run the counter in-process.
+
+    Args:
+        project_id: GCP project ID (None for default project)
+        verbose: Enable verbose logging
+        credentials: Optional shared google.auth credentials
+        use_cache: Reuse project lists and enabled APIs cached on disk (False re-lists them)
+
+    Returns:
+        Results dict in the same shape as the JSON export
+    """
+    with GCPComputeCounter(project_id=project_id, verbose=verbose, credentials=credentials,
+                           use_cache=use_cache) as counter:
+        counter.count_all()
+        return counter.to_dict()
+
+
 @click.command()
 @click.option(
     "--project",
@@ -411,7 +817,28 @@ class GCPComputeCounter:
     help="Comma-separated list of resources to count (gce,gke,cloud_run,cloud_functions,app_engine)",
     default="gce,gke,cloud_run,cloud_functions,app_engine",
 )
-def main(project_id, output, output_format, verbose, resources):
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="Re-list projects and enabled APIs instead of using the cached lists (cached for 24 hours)",
+)
+@click.option(
+    "--gce-filter",
+    help="Compute Engine filter applied server-side, e.g. 'status = RUNNING' (default: all VMs)",
+    default=None,
+)
+@click.option(
+    "--details/--no-details",
+    default=True,
+    help="Record per-resource details for the JSON export (--no-details only counts)",
+)
+@click.option(
+    "--max-concurrency",
+    type=click.IntRange(min=1),
+    help=f"Project API calls in flight at once (default: {MAX_CONCURRENCY})",
+    default=MAX_CONCURRENCY,
+)
+def main(project_id, output, output_format, verbose, resources, no_cache, gce_filter, details, max_concurrency):
     """
     Count all compute nodes across GCP services.
 
@@ -423,33 +850,31 @@ def main(project_id, output, output_format, verbose, resources):
         resource_list = [r.strip() for r in resources.split(",")]
 
         # Initialize counter
-        counter = GCPComputeCounter(project_id=project_id, verbose=verbose)
-
-        # Count resources based on filter
-        if "gce" in resource_list:
-            counter.count_compute_engine_vms()
-        if "gke" in resource_list:
-            counter.count_gke_nodes()
-        if "cloud_run" in resource_list:
-            counter.count_cloud_run_services()
-        if "cloud_functions" in resource_list:
-            counter.count_cloud_functions()
-        if "app_engine" in resource_list:
-            counter.count_app_engine_instances()
-
-        # If no filters, count all
-        if resources == "gce,gke,cloud_run,cloud_functions,app_engine":
-            counter.count_all()
-
-        # Print summary
-        counter.print_summary()
-
-        # Export if requested
-        if output:
-            if output_format == "json":
-                counter.export_json(output)
-            elif output_format == "csv":
-                counter.export_csv(output)
+        with GCPComputeCounter(
+            project_id=project_id,
+            verbose=verbose,
+            max_concurrency=max_concurrency,
+            collect_details=details,
+            gce_filter=gce_filter,
+            use_cache=not no_cache,
+        ) as counter:
+            counter.print_header()
+
+            # Count the selected resources (each exactly once)
+            unknown = [r for r in resource_list if r not in counter.count_methods()]
+            if unknown:
+                print(f"{Fore.YELLOW}Ignoring unknown resource type(s): {', '.join(unknown)}{Style.RESET_ALL}")
+            counter.count_all(resources=resource_list)
+
+            # Print summary
+            counter.print_summary()
+
+            # Export if requested
+            if output:
+                if output_format == "json":
+                    counter.export_json(output)
+                elif output_format == "csv":
+                    counter.export_csv(output)
 
     except DefaultCredentialsError:
         print(f"\n{Fore.RED}Error: GCP credentials not found.{Style.RESET_ALL}")
@@ -462,7 +887,6 @@ def main(project_id, output, output_format, verbose, resources):
     except Exception as e:
         print(f"\n{Fore.RED}Error: {e}{Style.RESET_ALL}")
         if verbose:
-            import traceback
             traceback.print_exc()
         sys.exit(1)
 
@@ -0,0 +1,25 @@
+"""
+Shared fixtures for the compute counter tests
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Make the counter scripts in the repository root importable, once for all test files
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope='session')
+def aws_counter_module():
+    """The aws_compute_counter module, imported once per test session (or xdist worker)."""
+    import aws_compute_counter
+    return aws_compute_counter
+
+
+@pytest.fixture(scope='session')
+def azure_counter_module():
+    """The azure_compute_counter module, imported once per test session (or xdist worker)."""
+    import azure_compute_counter
+    return azure_compute_counter
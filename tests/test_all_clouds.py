@@ -0,0 +1,117 @@
+"""
+Unit tests for the Multi-Cloud Compute Node Counter
+"""
+
+import io
+import json
+import os
+import sys
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+from click.testing import CliRunner
+
+import all_clouds
+
+
+class TestMultiCloudCounter:
+    """Test multi-cloud counter functionality."""
+
+    def test_quiet_output_is_only_json(self, tmp_path, monkeypatch):
+        """Test that --quiet keeps logs and errors off stdout when a provider fails."""
+        monkeypatch.setattr(all_clouds, 'CACHE_DIR', str(tmp_path))
+        gcp_module = Mock(**{'run.side_effect': Exception('permission denied')})
+
+        with patch.dict(sys.modules, {'gcp_compute_counter': gcp_module}), \
+                patch.object(all_clouds.MultiCloudCounter, 'gcp_credentials', (Mock(), 'test-project')):
+            result = CliRunner().invoke(
+                all_clouds.main, ['--quiet', '--providers', 'gcp', '--no-cache', '--verbose']
+            )
+
+        assert result.exit_code == 1
+        data = json.loads(result.stdout)
+        assert data['errors'] == ['GCP: permission denied']
+        assert 'All providers failed' in result.stderr
+        assert 'GCP error: permission denied' in result.stderr
+        assert '\x1b[' not in result.stderr
+        # --no-cache also bypasses the provider's own caches
+        assert gcp_module.run.call_args.kwargs['use_cache'] is False
+
+    def test_cache_is_keyed_on_identity(self, tmp_path, monkeypatch):
+        """Test that cached provider results are reused per signed-in account, and flagged."""
+        monkeypatch.setattr(all_clouds, 'CACHE_DIR', str(tmp_path))
+        gcp_module = Mock(**{'run.side_effect': [{'summary': {'gce': 1}}, {'summary': {'gce': 2}}]})
+
+        def count_as(principal):
+            gcp_module.credentials_principal.return_value = principal
+            counter = all_clouds.MultiCloudCounter()
+            counter.count_gcp()
+            return counter
+
+        with patch.dict(sys.modules, {'gcp_compute_counter': gcp_module}), \
+                patch.object(all_clouds.MultiCloudCounter, 'gcp_credentials', (Mock(), 'test-project')):
+            counter = count_as('alice@example.com')
+            assert counter.results['gcp']['summary'] == {'gce': 1}
+            assert counter.cached_results == {}
+
+            counter = count_as('alice@example.com')
+            assert counter.results['gcp']['summary'] == {'gce': 1}
+            assert counter.cached_results['gcp']['stale'] is False
+            output = io.BytesIO()
+            counter.write_json(output)
+            assert json.loads(output.getvalue())['cached_results']['gcp']['stale'] is False
+
+            # Another account never sees those results
+            counter = count_as('bob@example.com')
+            assert counter.results['gcp']['summary'] == {'gce': 2}
+            assert counter.cached_results == {}
+
+    def test_stale_cache_fallback(self, tmp_path, monkeypatch):
+        """Test that a failed provider falls back to recent cached results without failing the run."""
+        monkeypatch.setattr(all_clouds, 'CACHE_DIR', str(tmp_path))
+        gcp_module = Mock(credentials_principal=Mock(return_value='alice@example.com'),
+                          **{'run.return_value': {'summary': {'gce': 1}}})
+
+        def run_cli(*args):
+            return CliRunner().invoke(all_clouds.main, ['--quiet', '--providers', 'gcp', *args])
+
+        def age_cache(seconds):
+            for path in tmp_path.glob('gcp-*.json'):
+                os.utime(path, (time.time() - seconds, time.time() - seconds))
+
+        with patch.dict(sys.modules, {'gcp_compute_counter': gcp_module}), \
+                patch.object(all_clouds.MultiCloudCounter, 'gcp_credentials', (Mock(), 'test-project')):
+            assert run_cli().exit_code == 0
+            gcp_module.run.side_effect = Exception('permission denied')
+
+            age_cache(600)
+            result = run_cli()
+            assert result.exit_code == 0
+            data = json.loads(result.stdout)
+            assert data['multi_cloud_summary']['grand_total'] == 1
+            assert data['cached_results']['gcp']['stale'] is True
+
+            # Too old to show, or the cache is off
+            assert run_cli('--cache-ttl', '0').exit_code == 1
+            age_cache(2 * all_clouds.STALE_CACHE_MAX_AGE)
+            assert run_cli().exit_code == 1
+
+    def test_gcp_credentials_not_found(self, tmp_path, monkeypatch):
+        """Test that missing GCP credentials are reported with the GCP counter's message."""
+        from google.auth.exceptions import DefaultCredentialsError
+
+        monkeypatch.setattr(all_clouds, 'CACHE_DIR', str(tmp_path))
+        gcp_module = Mock(CREDENTIALS_NOT_FOUND="GCP credentials not found. Please run 'gcloud auth login'")
+
+        with patch.dict(sys.modules, {'gcp_compute_counter': gcp_module}), \
+                patch('google.auth.default', side_effect=DefaultCredentialsError('no credentials')):
+            counter = all_clouds.MultiCloudCounter(use_cache=False)
+            counter.count_gcp()
+
+        assert counter.errors == ["GCP: GCP credentials not found. Please run 'gcloud auth login'"]
+        gcp_module.run.assert_not_called()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -4,18 +4,37 @@ Unit tests for AWS Compute Counter
 
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-import sys
-import os
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def mock_ec2():
+    """EC2 client whose DescribeInstances paginator returns one running instance."""
+    mock_ec2 = Mock()
+    mock_paginator = Mock()
+    mock_paginator.paginate.return_value = [
+        {
+            'Reservations': [
+                {
+                    'Instances': [
+                        {
+                            'InstanceId': 'i-1234567890abcdef0',
+                            'InstanceType': 't2.micro',
+                            'State': {'Name': 'running'}
+                        }
+                    ]
+                }
+            ]
+        }
+    ]
+    mock_ec2.get_paginator.return_value = mock_paginator
+    return mock_ec2
 
 
 class TestAWSComputeCounter:
     """Test AWS compute counter functionality."""
 
-    @patch('boto3.client')
-    def test_get_all_regions(self, mock_boto_client):
+    @patch('boto3.session.Session')
+    def test_get_all_regions(self, mock_session, aws_counter_module):
         """Test fetching all AWS regions."""
         # Mock EC2 client response
         mock_ec2 = Mock()
@@ -26,47 +45,33 @@ class TestAWSComputeCounter:
                 {'RegionName': 'eu-west-1'},
             ]
         }
-        mock_boto_client.return_value = mock_ec2
+        mock_session.return_value.client.return_value = mock_ec2
 
-        from aws_compute_counter import AWSComputeCounter
-
-        counter = AWSComputeCounter(verbose=False)
+        counter = aws_counter_module.AWSComputeCounter(verbose=False)
         assert len(counter.regions) == 3
         assert 'us-east-1' in counter.regions
 
-    @patch('boto3.client')
-    def test_count_ec2_instances(self, mock_boto_client):
+    @patch('boto3.session.Session')
+    def test_count_ec2_instances(self, mock_session, aws_counter_module, mock_ec2):
         """Test counting EC2 instances."""
-        # Mock EC2 client with paginator
-        mock_ec2 = Mock()
-        mock_paginator = Mock()
-        mock_paginator.paginate.return_value = [
-            {
-                'Reservations': [
-                    {
-                        'Instances': [
-                            {
-                                'InstanceId': 'i-1234567890abcdef0',
-                                'InstanceType': 't2.micro',
-                                'State': {'Name': 'running'}
-                            }
-                        ]
-                    }
-                ]
-            }
-        ]
-        mock_ec2.get_paginator.return_value = mock_paginator
-        mock_boto_client.return_value = mock_ec2
-
-        from aws_compute_counter import AWSComputeCounter
+        mock_session.return_value.client.return_value = mock_ec2
 
-        counter = AWSComputeCounter(regions=['us-east-1'], verbose=False)
+        counter = aws_counter_module.AWSComputeCounter(regions=['us-east-1'], verbose=False)
         counter.count_ec2_instances()
 
-        assert counter.results['ec2']['us-east-1'] == 1
+        assert counter.results[('ec2', 'us-east-1')] == 1
+
+    @patch('boto3.session.Session')
+    def test_clients_are_cached(self, mock_session, aws_counter_module):
+        """Test that clients are created once per service and region."""
+        counter = aws_counter_module.AWSComputeCounter(regions=['us-east-1'], verbose=False)
+        assert counter._client('ec2', 'us-east-1') is counter._client('ec2', 'us-east-1')
+        counter._client('lambda', 'us-east-1')
 
-    @patch('boto3.client')
-    def test_count_lambda_functions(self, mock_boto_client):
+        assert mock_session.return_value.client.call_count == 2
+
+    @patch('boto3.session.Session')
+    def test_count_lambda_functions(self, mock_session, aws_counter_module):
         """Test counting Lambda functions."""
         # Mock Lambda client with paginator
         mock_lambda = Mock()
@@ -88,26 +93,156 @@ class TestAWSComputeCounter:
             }
         ]
         mock_lambda.get_paginator.return_value = mock_paginator
-        mock_boto_client.return_value = mock_lambda
+        mock_session.return_value.client.return_value = mock_lambda
+
+        counter = aws_counter_module.AWSComputeCounter(regions=['us-east-1'], verbose=False)
+        counter.count_lambda_functions()
+
+        assert counter.results[('lambda', 'us-east-1')] == 2
+
+    @patch('boto3.session.Session')
+    def test_count_eks_nodes(self, mock_session, aws_counter_module):
+        """Test counting EKS nodes across paginated clusters and nodegroups."""
+        mock_eks = Mock()
+        paginators = {
+            'list_clusters': Mock(**{'paginate.return_value': [
+                {'clusters': ['cluster-a']},
+                {'clusters': ['cluster-b']},
+            ]}),
+            'list_nodegroups': Mock(**{'paginate.return_value': [{'nodegroups': ['ng-1']}]}),
+        }
+        mock_eks.get_paginator.side_effect = paginators.get
+        mock_eks.describe_nodegroup.return_value = {
+            'nodegroup': {'scalingConfig': {'desiredSize': 3}}
+        }
+        mock_session.return_value.client.return_value = mock_eks
+
+        counter = aws_counter_module.AWSComputeCounter(regions=['us-east-1'], verbose=False)
+        counter.count_eks_nodes()
+
+        assert counter.results[('eks', 'us-east-1')] == 6
+        assert len(counter.region_details[('eks', 'us-east-1')]) == 2
 
-        from aws_compute_counter import AWSComputeCounter
+    @patch('boto3.session.Session')
+    def test_region_results_cache(self, mock_session, tmp_path, monkeypatch, aws_counter_module):
+        """Test that cached region results are reused within the TTL."""
+        monkeypatch.setattr(aws_counter_module, 'CACHE_DIR', str(tmp_path))
+        mock_client = Mock()
+        mock_client.get_caller_identity.return_value = {'Account': '123456789012'}
+        mock_client.get_paginator.return_value.paginate.return_value = [
+            {'Functions': [{'FunctionName': 'test-function', 'Runtime': 'python3.12', 'MemorySize': 128}]}
+        ]
+        mock_session.return_value.client.return_value = mock_client
+
+        for _ in range(2):
+            counter = aws_counter_module.AWSComputeCounter(regions=['us-east-1'], verbose=False, cache_ttl=60)
+            counter.count_lambda_functions()
+            assert counter.results[('lambda', 'us-east-1')] == 1
+
+        assert (tmp_path / '123456789012' / 'us-east-1' / 'lambda.json').exists()
+        # list_functions is paginated once; the second counter reads the cache
+        calls = [c for c in mock_client.get_paginator.call_args_list if c.args == ('list_functions',)]
+        assert len(calls) == 1
+
+    @patch('boto3.session.Session')
+    def test_resource_explorer_search(self, mock_session, aws_counter_module, mock_ec2):
+        """Test that Resource Explorer is searched in the aggregator region, with a region scan fallback."""
+        explorers = {
+            'us-east-1': Mock(**{'list_indexes.return_value': {
+                'Indexes': [{'Region': 'eu-west-1', 'Type': 'AGGREGATOR'}]
+            }}),
+            'eu-west-1': Mock(**{'get_paginator.return_value.paginate.return_value': [{
+                'Count': {'Complete': True},
+                'Resources': [
+                    {'Region': 'us-east-1', 'Arn': 'arn:aws:ec2:us-east-1:123456789012:instance/i-1'},
+                    {'Region': 'eu-west-1', 'Arn': 'arn:aws:ec2:eu-west-1:123456789012:instance/i-2'},
+                ],
+            }]}),
+        }
+
+        def client(service, region_name, config=None):
+            return explorers[region_name] if service == 'resource-explorer-2' else mock_ec2
+
+        mock_session.return_value.region_name = 'us-east-1'
+        mock_session.return_value.client.side_effect = client
+
+        counter = aws_counter_module.AWSComputeCounter(regions=['us-east-1', 'eu-west-1'], verbose=False,
+                                                       use_resource_explorer=True)
+        counter.count_ec2_instances()
+        assert counter.results[('ec2', 'us-east-1')] == 1
+        assert counter.results[('ec2', 'eu-west-1')] == 1
+        explorers['us-east-1'].list_indexes.assert_called_once_with(Type='AGGREGATOR')
+        explorers['us-east-1'].get_paginator.assert_not_called()
+
+        # Without an aggregator index, each region is scanned
+        explorers['us-east-1'].list_indexes.return_value = {'Indexes': []}
+        counter = aws_counter_module.AWSComputeCounter(regions=['us-east-1'], verbose=False,
+                                                       use_resource_explorer=True)
+        counter.count_ec2_instances()
+        assert counter.results[('ec2', 'us-east-1')] == 1
+        mock_ec2.get_paginator.assert_called_with('describe_instances')
+
+    @patch('boto3.session.Session')
+    def test_service_regions(self, mock_session, aws_counter_module):
+        """Test that only the regions SSM lists for a service are queried."""
+        mock_ssm = Mock()
+        mock_ssm.get_paginator.return_value.paginate.return_value = [
+            {'Parameters': [{'Value': 'us-east-1'}]},
+            {'Parameters': [{'Value': 'ap-south-1'}]},
+        ]
+        clients = {}
+
+        def client(service, region_name, config=None):
+            if service == 'ssm':
+                return mock_ssm
+            return clients.setdefault((service, region_name), Mock(**{
+                'get_paginator.return_value.paginate.return_value': [{'Functions': []}]
+            }))
+
+        mock_session.return_value.client.side_effect = client
 
-        counter = AWSComputeCounter(regions=['us-east-1'], verbose=False)
+        counter = aws_counter_module.AWSComputeCounter(regions=['eu-west-1', 'us-east-1'], verbose=False)
         counter.count_lambda_functions()
 
-        assert counter.results['lambda']['us-east-1'] == 2
+        mock_ssm.get_paginator.assert_called_once_with('get_parameters_by_path')
+        mock_ssm.get_paginator.return_value.paginate.assert_called_once_with(
+            Path='/aws/service/global-infrastructure/services/lambda/regions'
+        )
+        assert list(clients) == [('lambda', 'us-east-1')]
+        assert counter.results[('lambda', 'us-east-1')] == 0
+        assert ('lambda', 'eu-west-1') not in counter.results
 
-    def test_get_summary_empty(self):
-        """Test getting summary with no resources."""
-        from aws_compute_counter import AWSComputeCounter
+    @patch('boto3.session.Session')
+    def test_service_regions_fallback(self, mock_session, aws_counter_module):
+        """Test that every selected region is queried when the SSM lookup fails."""
+        mock_ssm = Mock()
+        mock_ssm.get_paginator.return_value.paginate.side_effect = Exception('AccessDenied')
+        clients = {}
+
+        def client(service, region_name, config=None):
+            if service == 'ssm':
+                return mock_ssm
+            return clients.setdefault((service, region_name), Mock(**{
+                'get_paginator.return_value.paginate.return_value': [{'Functions': []}]
+            }))
 
-        counter = AWSComputeCounter(regions=['us-east-1'], verbose=False)
+        mock_session.return_value.client.side_effect = client
+
+        counter = aws_counter_module.AWSComputeCounter(regions=['eu-west-1', 'us-east-1'], verbose=False)
+        counter.count_lambda_functions()
+
+        assert sorted(clients) == [('lambda', 'eu-west-1'), ('lambda', 'us-east-1')]
+        assert counter.results[('lambda', 'eu-west-1')] == 0
+
+    def test_get_summary_empty(self, aws_counter_module):
+        """Test getting summary with no resources."""
+        counter = aws_counter_module.AWSComputeCounter(regions=['us-east-1'], verbose=False)
         summary = counter.get_summary()
 
         assert len(summary) == 0
 
-    @patch('boto3.client')
-    def test_error_handling(self, mock_boto_client):
+    @patch('boto3.session.Session')
+    def test_error_handling(self, mock_session, aws_counter_module):
         """Test error handling for API failures."""
         from botocore.exceptions import ClientError
 
@@ -117,16 +252,14 @@ class TestAWSComputeCounter:
             {'Error': {'Code': 'AccessDeniedException', 'Message': 'Access denied'}},
             'DescribeInstances'
         )
-        mock_boto_client.return_value = mock_ec2
-
-        from aws_compute_counter import AWSComputeCounter
+        mock_session.return_value.client.return_value = mock_ec2
 
-        counter = AWSComputeCounter(regions=['us-east-1'], verbose=False)
+        counter = aws_counter_module.AWSComputeCounter(regions=['us-east-1'], verbose=False)
         # Should not raise exception, just log error
         counter.count_ec2_instances()
 
         # No results should be recorded
-        assert 'ec2' not in counter.results or 'us-east-1' not in counter.results['ec2']
+        assert ('ec2', 'us-east-1') not in counter.results
 
 
 if __name__ == '__main__':
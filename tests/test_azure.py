@@ -2,21 +2,47 @@
 Unit tests for Azure Compute Counter
 """
 
+import base64
+import io
+import json
+
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-import sys
-import os
+import time
+
+import requests
+from azure.core.credentials import AccessToken
+from urllib3 import HTTPResponse
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch, azure_counter_module):
+    """Keep the subscription and results caches out of the user's cache directory."""
+    monkeypatch.setattr(azure_counter_module, 'CACHE_DIR', str(tmp_path / 'csp-scripts' / 'azure'))
+
+
+def identity_credential(tid='tenant-1', oid='user-1'):
+    """A credential whose tokens carry the tenant and object ID claims of a signed-in identity."""
+    claims = base64.urlsafe_b64encode(json.dumps({'tid': tid, 'oid': oid}).encode()).decode().rstrip('=')
+    token = AccessToken(f'header.{claims}.signature', int(time.time()) + 3600)
+    return Mock(**{'get_token.return_value': token})
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def arm_response(status_code, body=None, headers=None):
+    """A raw ARM HTTP response, as returned by the shared requests session."""
+    headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    response.raw = HTTPResponse(body=io.BytesIO(json.dumps(body or {}).encode()), headers=headers, status=status_code,
+                                preload_content=False)
+    return response
 
 
 class TestAzureComputeCounter:
     """Test Azure compute counter functionality."""
 
-    @patch('azure.identity.DefaultAzureCredential')
-    @patch('azure.mgmt.resource.SubscriptionClient')
-    def test_get_subscriptions(self, mock_sub_client, mock_creds):
+    def test_get_subscriptions(self, azure_counter_module):
         """Test fetching Azure subscriptions."""
         # Mock subscription client
         mock_subscription = Mock()
@@ -24,20 +50,17 @@ class TestAzureComputeCounter:
         mock_subscription.display_name = 'Test Subscription'
         mock_subscription.state = 'Enabled'
 
-        mock_client = Mock()
-        mock_client.subscriptions.list.return_value = [mock_subscription]
-        mock_sub_client.return_value = mock_client
-
-        from azure_compute_counter import AzureComputeCounter
+        with patch.object(azure_counter_module, 'DefaultAzureCredential'), \
+                patch.object(azure_counter_module, 'SubscriptionClient') as mock_sub_client:
+            mock_client = Mock()
+            mock_client.subscriptions.list.return_value = [mock_subscription]
+            mock_sub_client.return_value = mock_client
 
-        counter = AzureComputeCounter(verbose=False)
+            counter = azure_counter_module.AzureComputeCounter(verbose=False)
         assert len(counter.subscriptions) == 1
         assert counter.subscriptions[0]['id'] == 'sub-12345'
 
-    @patch('azure.identity.DefaultAzureCredential')
-    @patch('azure.mgmt.resource.SubscriptionClient')
-    @patch('azure.mgmt.compute.ComputeManagementClient')
-    def test_count_virtual_machines(self, mock_compute_client, mock_sub_client, mock_creds):
+    def test_count_virtual_machines(self, azure_counter_module):
         """Test counting Azure Virtual Machines."""
         # Setup mocks
         mock_subscription = Mock()
@@ -45,31 +68,29 @@ class TestAzureComputeCounter:
         mock_subscription.display_name = 'Test Subscription'
         mock_subscription.state = 'Enabled'
 
-        mock_sub_client_instance = Mock()
-        mock_sub_client_instance.subscriptions.list.return_value = [mock_subscription]
-        mock_sub_client.return_value = mock_sub_client_instance
-
         # Mock VMs
         mock_vm = Mock()
         mock_vm.name = 'test-vm-1'
         mock_vm.location = 'eastus'
         mock_vm.hardware_profile.vm_size = 'Standard_B2s'
 
-        mock_compute_instance = Mock()
-        mock_compute_instance.virtual_machines.list_all.return_value = [mock_vm]
-        mock_compute_client.return_value = mock_compute_instance
+        with patch.object(azure_counter_module, 'DefaultAzureCredential'), \
+                patch.object(azure_counter_module, 'SubscriptionClient') as mock_sub_client, \
+                patch.object(azure_counter_module, 'ComputeManagementClient') as mock_compute_client:
+            mock_sub_client_instance = Mock()
+            mock_sub_client_instance.subscriptions.list.return_value = [mock_subscription]
+            mock_sub_client.return_value = mock_sub_client_instance
 
-        from azure_compute_counter import AzureComputeCounter
+            mock_compute_instance = Mock()
+            mock_compute_instance.virtual_machines.list_all.return_value = [mock_vm]
+            mock_compute_client.return_value = mock_compute_instance
 
-        counter = AzureComputeCounter(verbose=False)
-        counter.count_virtual_machines()
+            counter = azure_counter_module.AzureComputeCounter(verbose=False)
+            counter.count_virtual_machines()
 
         assert counter.results['vms']['Test Subscription'] == 1
 
-    @patch('azure.identity.DefaultAzureCredential')
-    @patch('azure.mgmt.resource.SubscriptionClient')
-    @patch('azure.mgmt.containerservice.ContainerServiceClient')
-    def test_count_aks_nodes(self, mock_container_client, mock_sub_client, mock_creds):
+    def test_count_aks_nodes(self, azure_counter_module):
         """Test counting AKS nodes."""
         # Setup subscription mock
         mock_subscription = Mock()
@@ -77,10 +98,6 @@ class TestAzureComputeCounter:
         mock_subscription.display_name = 'Test Subscription'
         mock_subscription.state = 'Enabled'
 
-        mock_sub_client_instance = Mock()
-        mock_sub_client_instance.subscriptions.list.return_value = [mock_subscription]
-        mock_sub_client.return_value = mock_sub_client_instance
-
         # Mock AKS cluster
         mock_pool = Mock()
         mock_pool.name = 'nodepool1'
@@ -91,24 +108,196 @@ class TestAzureComputeCounter:
         mock_cluster.name = 'test-cluster'
         mock_cluster.agent_pool_profiles = [mock_pool]
 
-        mock_container_instance = Mock()
-        mock_container_instance.managed_clusters.list.return_value = [mock_cluster]
-        mock_container_client.return_value = mock_container_instance
+        with patch.object(azure_counter_module, 'DefaultAzureCredential'), \
+                patch.object(azure_counter_module, 'SubscriptionClient') as mock_sub_client, \
+                patch.object(azure_counter_module, 'ContainerServiceClient') as mock_container_client:
+            mock_sub_client_instance = Mock()
+            mock_sub_client_instance.subscriptions.list.return_value = [mock_subscription]
+            mock_sub_client.return_value = mock_sub_client_instance
 
-        from azure_compute_counter import AzureComputeCounter
+            mock_container_instance = Mock()
+            mock_container_instance.managed_clusters.list.return_value = [mock_cluster]
+            mock_container_client.return_value = mock_container_instance
 
-        counter = AzureComputeCounter(verbose=False)
-        counter.count_aks_nodes()
+            counter = azure_counter_module.AzureComputeCounter(verbose=False)
+            counter.count_aks_nodes()
 
         assert counter.results['aks']['Test Subscription'] == 3
 
-    def test_get_summary_empty(self):
-        """Test getting summary with no resources."""
-        with patch('azure.identity.DefaultAzureCredential'):
-            with patch('azure.mgmt.resource.SubscriptionClient'):
-                from azure_compute_counter import AzureComputeCounter
+    def test_subscription_results_cache(self, azure_counter_module, tmp_path):
+        """Test that cached results are reused and flagged, and served stale when the API fails."""
+        AzureComputeCounter = azure_counter_module.AzureComputeCounter
+
+        mock_vm = Mock()
+        mock_vm.name = 'test-vm-1'
+        mock_vm.location = 'eastus'
+        mock_vm.hardware_profile.vm_size = 'Standard_B2s'
+
+        with patch.object(azure_counter_module, 'SubscriptionClient') as mock_sub_client, \
+                patch.object(azure_counter_module, 'ComputeManagementClient') as mock_compute_client:
+            mock_sub_client.return_value.subscriptions.get.return_value = Mock(
+                subscription_id='sub-12345', display_name='Test Subscription'
+            )
+            list_all = mock_compute_client.return_value.virtual_machines.list_all
+            list_all.return_value = [mock_vm]
+
+            # Results are not cached unless a TTL is given
+            counter = AzureComputeCounter(subscription_id='sub-12345', credential=Mock(), verbose=False)
+            counter.count_virtual_machines()
+            assert counter.cached_results['vms'] == {}
+
+            for _ in range(2):
+                counter = AzureComputeCounter(subscription_id='sub-12345', credential=identity_credential(),
+                                              verbose=False, cache_ttl=60)
+                counter.count_virtual_machines()
+                assert counter.results['vms']['Test Subscription'] == 1
+            assert list_all.call_count == 2
+            assert counter.cached_results['vms']['Test Subscription']['stale'] is False
+            assert '(1, cached)' in counter.get_summary()[0][2]
+            cache_file = tmp_path / 'csp-scripts' / 'azure' / counter._identity_key() / 'sub-12345' / 'vms.json'
+
+            # Another identity, or one that cannot be determined, does not see those results
+            for credential in (identity_credential(oid='user-2'), Mock()):
+                counter = AzureComputeCounter(subscription_id='sub-12345', credential=credential, verbose=False,
+                                              cache_ttl=60)
+                counter.count_virtual_machines()
+                assert counter.cached_results['vms'] == {}
+            assert list_all.call_count == 4
+
+            # An expired entry is still better than nothing when the API call fails, but is flagged
+            entry = json.loads(cache_file.read_text())
+            cache_file.write_text(json.dumps(dict(entry, ts=0)))
+            list_all.side_effect = Exception('throttled')
+            counter = AzureComputeCounter(subscription_id='sub-12345', credential=identity_credential(),
+                                          verbose=False, cache_ttl=60)
+            counter.count_virtual_machines()
+            assert counter.results['vms']['Test Subscription'] == 1
+            assert counter.to_dict()['cached_results']['vms']['Test Subscription']['stale'] is True
+
+    def test_specified_subscription_name(self, azure_counter_module):
+        """Test that a specified subscription is fetched on its own, keeping its display name."""
+        AzureComputeCounter = azure_counter_module.AzureComputeCounter
+
+        with patch.object(azure_counter_module, 'SubscriptionClient') as mock_sub_client:
+            subscriptions = mock_sub_client.return_value.subscriptions
+            subscriptions.get.return_value = Mock(subscription_id='sub-12345', display_name='Production')
 
-                counter = AzureComputeCounter(subscription_id='test-sub', verbose=False)
+            counter = AzureComputeCounter(subscription_id='sub-12345', credential=Mock(), verbose=False)
+            assert counter.subscriptions == [{'id': 'sub-12345', 'name': 'Production'}]
+            subscriptions.list.assert_not_called()
+
+            # The placeholder name is used if the subscription cannot be fetched
+            subscriptions.get.side_effect = Exception('forbidden')
+            counter = AzureComputeCounter(subscription_id='sub-12345', credential=Mock(), verbose=False)
+            assert counter.subscriptions == [{'id': 'sub-12345', 'name': 'Specified Subscription'}]
+
+    def test_arm_batch_listing(self, azure_counter_module):
+        """Test that ARM $batch listings are used, with SDK fallback for failed or malformed subscriptions."""
+        AzureComputeCounter = azure_counter_module.AzureComputeCounter
+
+        mock_vm = Mock()
+        mock_vm.name = 'sdk-vm'
+        mock_vm.location = 'westus'
+        mock_vm.hardware_profile.vm_size = 'Standard_B1s'
+
+        with patch.object(azure_counter_module, 'SubscriptionClient'), \
+                patch.object(azure_counter_module, 'ComputeManagementClient') as mock_compute_client:
+            mock_compute_client.return_value.virtual_machines.list_all.return_value = [mock_vm]
+
+            credential = Mock(**{'get_token.return_value': AccessToken('token', int(time.time()) + 3600)})
+            counter = AzureComputeCounter(subscription_id='sub-1', credential=credential, verbose=False,
+                                          arm_batch=True)
+            counter.subscriptions = [
+                {'id': 'sub-1', 'name': 'One'}, {'id': 'sub-2', 'name': 'Two'}, {'id': 'sub-3', 'name': 'Three'}
+            ]
+            counter._session.request = Mock(return_value=arm_response(200, {'responses': [
+                {'name': 'sub-1', 'httpStatusCode': 200, 'content': {'value': [
+                    {'name': 'vm-a', 'location': 'eastus', 'properties': {'hardwareProfile': {'vmSize': 'B2s'}}},
+                    {'name': 'vm-b', 'location': 'eastus', 'properties': {'hardwareProfile': {'vmSize': 'B2s'}}},
+                ]}},
+                {'name': 'sub-2', 'httpStatusCode': 403, 'content': {}},
+                {'name': 'sub-3', 'httpStatusCode': 200, 'content': {'value': [{'name': 'vm-without-location'}]}},
+            ]}))
+
+            counter.count_virtual_machines()
+
+        assert counter._session.request.call_count == 1
+        assert counter.results['vms'] == {'One': 2, 'Two': 1, 'Three': 1}
+        assert counter.subscription_details['vms']['One']['size'] == ['B2s', 'B2s']
+        assert counter.to_dict()['subscription_details']['vms']['One'][0] == {
+            'name': 'vm-a', 'location': 'eastus', 'size': 'B2s', 'status': 'running'
+        }
+        assert mock_compute_client.call_count == 2
+
+    def test_arm_batch_throttled(self, azure_counter_module, capsys):
+        """Test that ARM $batch requests are retried when throttled, and accepted batches are polled."""
+        AzureComputeCounter = azure_counter_module.AzureComputeCounter
+
+        credential = Mock(**{'get_token.return_value': AccessToken('token', int(time.time()) + 3600)})
+        with patch.object(azure_counter_module, 'SubscriptionClient'):
+            counter = AzureComputeCounter(subscription_id='sub-1', credential=credential, verbose=True,
+                                          arm_batch=True)
+        counter.subscriptions = [{'id': 'sub-1', 'name': 'One'}]
+        location = 'https://management.azure.com/batchOperations/1?api-version=2020-06-01'
+        counter._session.request = Mock(side_effect=[
+            arm_response(429, headers={'Retry-After': '0'}),
+            arm_response(202, headers={'Location': location, 'Retry-After': '0'}),
+            arm_response(200, {'responses': [
+                {'name': 'sub-1', 'httpStatusCode': 200, 'content': {'value': [], 'nextLink': location}},
+            ]}),
+            arm_response(200, {'value': [{'name': 'vm-a', 'location': 'eastus'}]}),
+        ])
+
+        counter.count_virtual_machines()
+
+        assert counter.results['vms'] == {'One': 1}
+        methods = [c.args[0] for c in counter._session.request.call_args_list]
+        assert methods == ['POST', 'POST', 'GET', 'GET']
+        assert 'Throttled by ARM' in capsys.readouterr().out
+
+    def test_tokens_are_cached(self, azure_counter_module):
+        """Test that a token is reused until it is about to expire."""
+        credential = Mock()
+        credential.get_token.return_value = AccessToken('token', int(time.time()) + 3600)
+        cached = azure_counter_module._CachedTokenCredential(credential)
+
+        scope = 'https://management.azure.com/.default'
+        assert cached.get_token(scope).token == 'token'
+        assert cached.get_token(scope).token == 'token'
+        assert credential.get_token.call_count == 1
+
+        credential.get_token.return_value = AccessToken('expiring', int(time.time()) + 60)
+        cached.get_token('other-scope')
+        cached.get_token('other-scope')
+        assert credential.get_token.call_count == 3
+
+    def test_unregistered_providers_are_skipped(self, azure_counter_module):
+        """Test that resource types whose provider is not registered are not listed."""
+        AzureComputeCounter = azure_counter_module.AzureComputeCounter
+
+        compute = Mock(namespace='Microsoft.Compute', registration_state='Registered')
+        containers = Mock(namespace='Microsoft.ContainerService', registration_state='NotRegistered')
+
+        with patch.object(azure_counter_module, 'SubscriptionClient'), \
+                patch.object(azure_counter_module, 'ResourceManagementClient') as mock_resource_client, \
+                patch.object(azure_counter_module, 'ComputeManagementClient') as mock_compute_client, \
+                patch.object(azure_counter_module, 'ContainerServiceClient') as mock_container_client:
+            mock_resource_client.return_value.providers.list.return_value = [compute, containers]
+            mock_compute_client.return_value.virtual_machines.list_all.return_value = []
+
+            counter = AzureComputeCounter(subscription_id='sub-1', credential=Mock(), verbose=False)
+            counter.subscriptions = [{'id': 'sub-1', 'name': 'One'}]
+            counter.count_all(['vms', 'aks'])
+
+        mock_resource_client.return_value.providers.list.assert_called_once()
+        mock_compute_client.return_value.virtual_machines.list_all.assert_called_once()
+        mock_container_client.assert_not_called()
+
+    def test_get_summary_empty(self, azure_counter_module):
+        """Test getting summary with no resources."""
+        with patch.object(azure_counter_module, 'DefaultAzureCredential'):
+            with patch.object(azure_counter_module, 'SubscriptionClient'):
+                counter = azure_counter_module.AzureComputeCounter(subscription_id='test-sub', verbose=False)
                 summary = counter.get_summary()
 
                 assert len(summary) == 0
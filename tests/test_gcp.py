@@ -4,129 +4,178 @@ Unit tests for GCP Compute Counter
 
 import pytest
 from unittest.mock import Mock, patch, MagicMock
-import sys
-import os
+from types import SimpleNamespace
 
-# Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from google.auth.exceptions import DefaultCredentialsError
 
+import gcp_compute_counter
+from gcp_compute_counter import GCPComputeCounter
 
-class TestGCPComputeCounter:
-    """Test GCP compute counter functionality."""
-
-    @patch('google.auth.default')
-    def test_initialization(self, mock_auth):
-        """Test GCP counter initialization."""
-        mock_auth.return_value = (Mock(), 'test-project')
-
-        from gcp_compute_counter import GCPComputeCounter
-
-        counter = GCPComputeCounter(project_id='test-project', verbose=False)
-        assert counter.project_id == 'test-project'
-        assert len(counter.projects) == 1
 
-    @patch('google.auth.default')
-    @patch('google.cloud.compute_v1.InstancesClient')
-    def test_count_compute_engine_vms(self, mock_instances_client, mock_auth):
-        """Test counting Compute Engine VMs."""
-        mock_auth.return_value = (Mock(), 'test-project')
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep the project and enabled-API caches out of the user's cache directory."""
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    monkeypatch.setattr(gcp_compute_counter, 'CACHE_DIR', str(tmp_path / 'csp-scripts' / 'gcp'))
 
-        # Mock instance
-        mock_instance = Mock()
-        mock_instance.name = 'test-vm-1'
-        mock_instance.machine_type = 'zones/us-central1-a/machineTypes/n1-standard-1'
-        mock_instance.status = 'RUNNING'
 
-        # Mock aggregated list response
-        mock_response = Mock()
-        mock_response.instances = [mock_instance]
+@pytest.fixture(autouse=True)
+def mock_auth():
+    """Resolve default credentials to a mock for the 'test-project' project."""
+    with patch('gcp_compute_counter.google_auth_default', return_value=(Mock(), 'test-project')) as mock_auth:
+        yield mock_auth
 
-        mock_client = Mock()
-        mock_client.aggregated_list.return_value = [('zones/us-central1-a', mock_response)]
-        mock_instances_client.return_value = mock_client
-
-        from gcp_compute_counter import GCPComputeCounter
-
-        counter = GCPComputeCounter(project_id='test-project', verbose=False)
-        counter.count_compute_engine_vms()
 
-        assert counter.results['gce']['test-project'] == 1
+@pytest.fixture(scope='module')
+def counter():
+    """A counter shared by tests that only read its initial state (never count with it)."""
+    return GCPComputeCounter(project_id='test-project', credentials=Mock(), verbose=False)
 
-    @patch('google.auth.default')
-    @patch('google.cloud.container_v1.ClusterManagerClient')
-    def test_count_gke_nodes(self, mock_cluster_client, mock_auth):
-        """Test counting GKE nodes."""
-        mock_auth.return_value = (Mock(), 'test-project')
 
-        # Mock node pool
-        mock_node_pool = Mock()
-        mock_node_pool.name = 'default-pool'
-        mock_node_pool.initial_node_count = 3
+def list_one_instance(mock_client):
+    """InstancesClient listing one VM in us-central1-a."""
+    mock_instance = SimpleNamespace(
+        name='test-vm-1',
+        machine_type='zones/us-central1-a/machineTypes/n1-standard-1',
+        status='RUNNING',
+    )
+    mock_client.aggregated_list.return_value = [
+        ('zones/us-central1-a', SimpleNamespace(instances=[mock_instance]))
+    ]
 
-        # Mock cluster
-        mock_cluster = Mock()
-        mock_cluster.name = 'test-cluster'
-        mock_cluster.location = 'us-central1'
-        mock_cluster.node_pools = [mock_node_pool]
 
-        # Mock response
-        mock_response = Mock()
-        mock_response.clusters = [mock_cluster]
+def list_one_cluster(mock_client):
+    """ClusterManagerClient listing one cluster with a three-node pool."""
+    mock_node_pool = SimpleNamespace(name='default-pool', initial_node_count=3)
+    mock_cluster = SimpleNamespace(name='test-cluster', location='us-central1', node_pools=[mock_node_pool])
+    mock_client.list_clusters.return_value = SimpleNamespace(clusters=[mock_cluster])
 
-        mock_client = Mock()
-        mock_client.list_clusters.return_value = mock_response
-        mock_cluster_client.return_value = mock_client
 
-        from gcp_compute_counter import GCPComputeCounter
+def list_one_function(mock_client):
+    """CloudFunctionsServiceClient listing one function."""
+    mock_function = SimpleNamespace(
+        name='projects/test-project/locations/us-central1/functions/test-function',
+        runtime='python39',
+    )
+    mock_client.list_functions.return_value = [mock_function]
 
-        counter = GCPComputeCounter(project_id='test-project', verbose=False)
-        counter.count_gke_nodes()
 
-        assert counter.results['gke']['test-project'] == 3
+# (client setup, counter method, results key, expected count)
+COUNT_CASES = [
+    pytest.param(list_one_instance, 'count_compute_engine_vms', 'gce', 1, id='gce'),
+    pytest.param(list_one_cluster, 'count_gke_nodes', 'gke', 3, id='gke'),
+    pytest.param(list_one_function, 'count_cloud_functions', 'cloud_functions', 1, id='cloud_functions'),
+]
 
-    @patch('google.auth.default')
-    @patch('google.cloud.functions_v1.CloudFunctionsServiceClient')
-    def test_count_cloud_functions(self, mock_functions_client, mock_auth):
-        """Test counting Cloud Functions."""
-        mock_auth.return_value = (Mock(), 'test-project')
 
-        # Mock function
-        mock_function = Mock()
-        mock_function.name = 'projects/test-project/locations/us-central1/functions/test-function'
-        mock_function.runtime = 'python39'
+class TestGCPComputeCounter:
+    """Test GCP compute counter functionality."""
 
-        mock_client = Mock()
-        mock_client.list_functions.return_value = [mock_function]
-        mock_functions_client.return_value = mock_client
+    @pytest.fixture(autouse=True)
+    def mock_clients(self):
+        """Patch the Compute Engine, GKE and Cloud Functions client classes, keyed by results key."""
+        with patch('google.cloud.compute_v1.InstancesClient') as mock_instances_client, \
+                patch('google.cloud.container_v1.ClusterManagerClient') as mock_cluster_client, \
+                patch('google.cloud.functions_v1.CloudFunctionsServiceClient') as mock_functions_client:
+            yield {
+                'gce': mock_instances_client,
+                'gke': mock_cluster_client,
+                'cloud_functions': mock_functions_client,
+            }
+
+    def test_initialization(self, counter):
+        """Test GCP counter initialization."""
+        assert counter.project_id == 'test-project'
+        assert len(counter.projects) == 1
 
-        from gcp_compute_counter import GCPComputeCounter
+    @pytest.mark.parametrize('client_setup, count_method, results_key, expected_count', COUNT_CASES)
+    def test_count_service(self, mock_clients, client_setup, count_method, results_key, expected_count):
+        """Test counting each service from a mocked client listing."""
+        client_setup(mock_clients[results_key].return_value)
 
         counter = GCPComputeCounter(project_id='test-project', verbose=False)
-        counter.count_cloud_functions()
-
-        assert counter.results['cloud_functions']['test-project'] == 1
-
-    def test_get_summary_empty(self):
+        getattr(counter, count_method)()
+
+        assert counter.results[results_key]['test-project'] == expected_count
+
+    def test_disabled_apis_are_skipped(self, mock_clients):
+        """Test that resource types whose API is disabled are not listed."""
+        compute = SimpleNamespace(name='projects/123/services/compute.googleapis.com',
+                                  state=gcp_compute_counter.service_usage_v1.State.ENABLED)
+        mock_clients['gce'].return_value.aggregated_list.return_value = []
+
+        with patch.object(gcp_compute_counter.service_usage_v1, 'ServiceUsageClient') as mock_usage_client:
+            mock_usage_client.return_value.batch_get_services.return_value = SimpleNamespace(services=[compute])
+
+            credentials = Mock()
+            counter = GCPComputeCounter(project_id='test-project', credentials=credentials, verbose=False)
+            counter.count_all(['gce', 'gke'])
+            assert counter.to_dict()['skipped_by_cached_apis'] == {}
+
+            # Skips based on the cached API list are reported
+            counter = GCPComputeCounter(project_id='test-project', credentials=credentials, verbose=False)
+            counter.count_all(['gce', 'gke'])
+            assert counter.to_dict()['skipped_by_cached_apis'] == {'gke': ['test-project']}
+
+        mock_usage_client.return_value.batch_get_services.assert_called_once()
+        assert mock_clients['gce'].return_value.aggregated_list.call_count == 2
+        mock_clients['gke'].assert_not_called()
+
+    def test_project_list_cache(self):
+        """Test that the project list is reused from disk until --no-cache re-lists it."""
+        project = SimpleNamespace(project_id='test-project', display_name='Test Project')
+        credentials = SimpleNamespace(valid=True, service_account_email='counter@test-project.iam.gserviceaccount.com')
+
+        with patch.object(gcp_compute_counter.resourcemanager_v3, 'ProjectsClient') as mock_projects_client:
+            search_projects = mock_projects_client.return_value.search_projects
+            search_projects.return_value = [project]
+
+            for _ in range(2):
+                counter = GCPComputeCounter(credentials=credentials, verbose=False)
+                assert counter.projects == [{'id': 'test-project', 'name': 'Test Project'}]
+            assert search_projects.call_count == 1
+
+            GCPComputeCounter(credentials=credentials, verbose=False, use_cache=False)
+            assert search_projects.call_count == 2
+
+    def test_project_list_cache_per_user(self):
+        """Test that gcloud user credentials get a project list cache of their own."""
+        project = SimpleNamespace(project_id='test-project', display_name='Test Project')
+        tokeninfo = {'alice-token': {'sub': '1', 'email': 'alice@example.com'},
+                     'bob-token': {'sub': '2', 'email': 'bob@example.com'}}
+
+        def get(url, params, timeout):
+            return Mock(**{'json.return_value': tokeninfo[params['access_token']]})
+
+        with patch.object(gcp_compute_counter.resourcemanager_v3, 'ProjectsClient') as mock_projects_client, \
+                patch.object(gcp_compute_counter.requests, 'get', side_effect=get):
+            search_projects = mock_projects_client.return_value.search_projects
+            search_projects.return_value = [project]
+
+            for token in ('alice-token', 'alice-token', 'bob-token'):
+                GCPComputeCounter(credentials=SimpleNamespace(valid=True, token=token), verbose=False)
+            assert search_projects.call_count == 2
+
+        # Without a known account nothing is cached
+        with patch.object(gcp_compute_counter.resourcemanager_v3, 'ProjectsClient') as mock_projects_client, \
+                patch.object(gcp_compute_counter.requests, 'get', side_effect=Exception('offline')):
+            search_projects = mock_projects_client.return_value.search_projects
+            search_projects.return_value = [project]
+
+            for _ in range(2):
+                GCPComputeCounter(credentials=SimpleNamespace(valid=True, token='carol-token'), verbose=False)
+            assert search_projects.call_count == 2
+
+    def test_get_summary_empty(self, counter):
         """Test getting summary with no resources."""
-        with patch('google.auth.default') as mock_auth:
-            mock_auth.return_value = (Mock(), 'test-project')
-
-            from gcp_compute_counter import GCPComputeCounter
+        summary = counter.get_summary()
 
-            counter = GCPComputeCounter(project_id='test-project', verbose=False)
-            summary = counter.get_summary()
+        assert len(summary) == 0
 
-            assert len(summary) == 0
-
-    @patch('google.auth.default')
     def test_credentials_error(self, mock_auth):
         """Test handling of missing credentials."""
-        from google.auth.exceptions import DefaultCredentialsError
-
         mock_auth.side_effect = DefaultCredentialsError()
 
-        from gcp_compute_counter import GCPComputeCounter
-
         with pytest.raises(Exception, match="GCP credentials not found"):
             GCPComputeCounter(project_id='test-project', verbose=False)
 